@@ -0,0 +1,93 @@
+from threading import Event, Lock, Thread
+
+from engine import Engine, MATE, MAX_PLY
+from position import Position
+
+
+class Analysis:
+    """The class for analysing positions on a thread of its own.
+
+    Starting the analysis of a position drops the one going on without
+    waiting for it: every search gets a stop event of its own, and the
+    thread of the next search waits for the last one to wind down.
+    """
+
+    def __init__(self, notify=None, hash_mb=16):
+        """
+        @param notify: called from the search thread whenever news arrive
+        @param hash_mb: megabytes of the transposition table
+        """
+        self.engine = Engine(hash_mb)
+        self.notify = notify
+        self.lock = Lock()  # guards the latest result
+        self.result = None  # (SearchResult, the side to move) or None
+        self.thread = None
+        self.stop_event = None
+
+    def start(self, moves):
+        """Analyse the position the moves lead to from the start."""
+        self.stop()
+        self.stop_event = Event()
+        self.thread = Thread(target=self._run, daemon=True, args=(
+            list(moves), self.thread, self.stop_event))
+        self.thread.start()
+
+    def stop(self):
+        """Drop the analysis going on, if any."""
+        if self.stop_event is not None:
+            self.stop_event.set()
+        with self.lock:
+            self.result = None
+
+    def close(self):
+        """Stop analysing and wait for the search thread to end."""
+        self.stop()
+        if self.thread is not None:
+            self.thread.join()
+            self.thread = None
+        self.engine.close()
+
+    def latest(self):
+        """Return the score for white, the best move, and the depth.
+
+        None is returned until the first iteration of the position is done.
+        """
+        with self.lock:
+            if self.result is None:
+                return None
+            result, turn = self.result
+        score = result.score if turn == 'w' else -result.score
+        return score, result.move, result.depth
+
+    def _run(self, moves, previous, stop_event):
+        """Search a position until stopped, on the search thread."""
+        if previous is not None:  # the engine searches one position at once
+            previous.join()
+        if stop_event.is_set():  # already replaced by another position
+            return
+        position = Position()
+        for move in moves:
+            position.make_move(move)
+        turn = position.turn
+
+        def report(result):
+            """Keep the result of an iteration and pass the news on."""
+            with self.lock:
+                if stop_event.is_set():
+                    return  # stale, the position has changed since
+                self.result = result, turn
+            if self.notify is not None:
+                self.notify()
+
+        self.engine.stop_event = stop_event
+        self.engine.search(position, MAX_PLY, callback=report)
+
+
+def white_share(score):
+    """Return the share of an evaluation bar that goes to white, 0 to 1."""
+    if score >= MATE - MAX_PLY:
+        return 1.0
+    if score <= -MATE + MAX_PLY:
+        return 0.0
+    # a logistic curve, a pawn up is about 64 percent
+    return 1 / (1 + 10 ** (-score / 400))
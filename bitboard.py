@@ -0,0 +1,106 @@
+# bit n of a bitboard stands for square n of the board list in prep.Setup,
+# so bit 0 -> a8, bit 7 -> h8, bit 56 -> a1, and bit 63 -> h1
+
+FULL = (1 << 64) - 1
+PROMOTION_RANKS = 0xFF | 0xFF << 56  # the eighth and the first rank
+FILE_A = sum(1 << row * 8 for row in range(8))
+FILE_H = FILE_A << 7
+
+# (file step, rank step) with ranks counted downwards like the square indexes
+ROOK_DIRECTIONS = ((0, -1), (0, 1), (-1, 0), (1, 0))
+BISHOP_DIRECTIONS = ((1, -1), (-1, -1), (-1, 1), (1, 1))
+KNIGHT_STEPS = ((1, -2), (2, -1), (2, 1), (1, 2),
+                (-1, 2), (-2, 1), (-2, -1), (-1, -2))
+
+
+def _squares_along(square, steps, repeat):
+    """Collect squares reached from a square by the steps given."""
+    squares = []
+    for file_step, rank_step in steps:
+        file, rank = square % 8 + file_step, square // 8 + rank_step
+        while 0 <= file <= 7 and 0 <= rank <= 7:
+            squares.append(rank * 8 + file)
+            if not repeat:
+                break
+            file, rank = file + file_step, rank + rank_step
+    return squares
+
+
+def _bitboard(squares):
+    """Turn squares into a bitboard."""
+    bitboard = 0
+    for square in squares:
+        bitboard |= 1 << square
+    return bitboard
+
+
+KNIGHT_ATTACKS = [_bitboard(_squares_along(square, KNIGHT_STEPS, False))
+                  for square in range(64)]
+KING_ATTACKS = [_bitboard(_squares_along(
+    square, ROOK_DIRECTIONS + BISHOP_DIRECTIONS, False))
+    for square in range(64)]
+PAWN_ATTACKS = {  # squares a pawn of the given color attacks
+    'w': [_bitboard(_squares_along(square, ((-1, -1), (1, -1)), False))
+          for square in range(64)],
+    'b': [_bitboard(_squares_along(square, ((-1, 1), (1, 1)), False))
+          for square in range(64)]
+}
+
+# rays of each direction, split by whether square indexes grow along them,
+# which tells if the nearest blocker is the lowest or the highest bit
+RAYS = {direction: [_bitboard(_squares_along(square, (direction,), True))
+                    for square in range(64)]
+        for direction in ROOK_DIRECTIONS + BISHOP_DIRECTIONS}
+ROOK_RAYS = ([RAYS[(0, 1)], RAYS[(1, 0)]], [RAYS[(0, -1)], RAYS[(-1, 0)]])
+BISHOP_RAYS = ([RAYS[(-1, 1)], RAYS[(1, 1)]], [RAYS[(1, -1)], RAYS[(-1, -1)]])
+
+
+def squares_of(bitboard):
+    """Yield the squares set in a bitboard, from the lowest."""
+    while bitboard:
+        lowest = bitboard & -bitboard
+        yield lowest.bit_length() - 1
+        bitboard ^= lowest
+
+
+def _slider_attacks(square, occupied, rays):
+    """Return the attacks along rays, each stopping at its first blocker."""
+    attacks = 0
+    increasing, decreasing = rays
+    for ray in increasing:
+        ray = ray[square]
+        blockers = ray & occupied
+        if blockers:
+            ray ^= ray & -(blockers & -blockers) << 1
+        attacks |= ray
+    for ray in decreasing:
+        ray = ray[square]
+        blockers = ray & occupied
+        if blockers:
+            ray &= -(1 << blockers.bit_length() - 1)
+        attacks |= ray
+    return attacks
+
+
+def rook_attacks(square, occupied):
+    """Return squares a rook attacks from a square."""
+    return _slider_attacks(square, occupied, ROOK_RAYS)
+
+
+def bishop_attacks(square, occupied):
+    """Return squares a bishop attacks from a square."""
+    return _slider_attacks(square, occupied, BISHOP_RAYS)
+
+
+def _between(start, end):
+    """Return the squares strictly between two squares on a line."""
+    for ray in RAYS.values():
+        if ray[start] >> end & 1:
+            return ray[start] ^ ray[end] ^ 1 << end
+    return 0
+
+
+BETWEEN = [[_between(start, end) for end in range(64)] for start in range(64)]
+# squares a rook or a bishop reaches from a square on an empty board
+ROOK_LINES = [rook_attacks(square, 0) for square in range(64)]
+BISHOP_LINES = [bishop_attacks(square, 0) for square in range(64)]
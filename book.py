@@ -0,0 +1,177 @@
+from argparse import ArgumentParser
+from heapq import merge
+from mmap import ACCESS_READ, mmap
+from os import path as os_path, remove
+from random import Random
+from struct import Struct
+from sys import stderr
+from tempfile import mkstemp
+from time import perf_counter
+
+from pgn import parse_game, parse_san, split_games
+from position import Position
+
+
+# entries of 16 bytes, sorted by hash: hash, weight, move, and two spare bytes
+ENTRY = Struct('<QIH2x')
+MAX_PLY = 20  # plies of every game to put into a book by default
+RUN_ENTRIES = 2 ** 20  # (hash, move) pairs to count before sorting to disk
+# weights of a move by the result for the side that played it
+WEIGHTS = {'1-0': (2, 0), '0-1': (0, 2), '1/2-1/2': (1, 1), '*': (1, 1)}
+
+
+def _write_run(counts, directory):
+    """Write counted (hash, move) pairs to a sorted temporary file."""
+    handle, run_path = mkstemp(suffix='.run', dir=directory)
+    with open(handle, 'wb') as run:
+        for (hash_, move), weight in sorted(counts.items()):
+            run.write(ENTRY.pack(hash_, weight, move))
+    return run_path
+
+
+def _read_run(run_path):
+    """Yield the (hash, move, weight) entries of a temporary file."""
+    with open(run_path, 'rb') as run:
+        while True:
+            data = run.read(ENTRY.size * 4096)
+            if not data:
+                return
+            for hash_, weight, move in ENTRY.iter_unpack(data):
+                yield hash_, move, weight
+
+
+def _count_moves(text, max_ply, counts):
+    """Add the first moves of a game to the (hash, move) weights."""
+    tags, sans, result = parse_game(text)
+    weights = WEIGHTS.get(result, (1, 1))
+    try:
+        position = Position(tags.get('FEN'))
+        for san in sans[:max_ply]:
+            move = parse_san(position, san)
+            weight = weights[position.turn == 'b']
+            if weight:
+                key = position.hash, move
+                counts[key] = counts.get(key, 0) + weight
+            position.make_move(move)
+    except ValueError:
+        pass  # the moves before a broken one still count
+
+
+def build_book(pgn_paths, book_path, max_ply=MAX_PLY):
+    """Build a book file from PGN files and return its number of entries.
+
+    Moves get counted in memory up to RUN_ENTRIES pairs at a time, then
+    sorted runs on disk are merged, so neither the PGN files nor the book
+    ever have to fit into memory.
+    """
+    directory = os_path.dirname(os_path.abspath(book_path))
+    counts, runs = {}, []
+    try:
+        for pgn_path in pgn_paths:
+            with open(pgn_path, encoding='utf-8', errors='replace') as file:
+                for text in split_games(file):
+                    _count_moves(text, max_ply, counts)
+                    if len(counts) >= RUN_ENTRIES:
+                        runs.append(_write_run(counts, directory))
+                        counts = {}
+        if counts or not runs:
+            runs.append(_write_run(counts, directory))
+
+        # merge the runs, adding up the weights of the same move
+        entries = 0
+        with open(book_path, 'wb') as book:
+            last, total = None, 0
+            for hash_, move, weight in merge(*map(_read_run, runs)):
+                if (hash_, move) != last:
+                    if last is not None:
+                        book.write(ENTRY.pack(last[0], min(total, 2 ** 32 - 1),
+                                              last[1]))
+                        entries += 1
+                    last, total = (hash_, move), 0
+                total += weight
+            if last is not None:
+                book.write(ENTRY.pack(last[0], min(total, 2 ** 32 - 1),
+                                      last[1]))
+                entries += 1
+        return entries
+    finally:
+        for run_path in runs:
+            remove(run_path)
+
+
+class OpeningBook:
+    """The class for opening books read through a memory map.
+
+    Nothing of the file is loaded up front: lookups binary-search the
+    mapped entries, so only the pages they touch get read from disk.
+    """
+
+    def __init__(self, path, seed=None):
+        """
+        @param path: a book file made by build_book()
+        @param seed: a seed for picking among book moves
+        """
+        self.file = open(path, 'rb')
+        size = os_path.getsize(path)
+        # an empty file cannot be mapped, and then there is nothing to find
+        self.map = mmap(self.file.fileno(), 0, access=ACCESS_READ) \
+            if size else b''
+        self.entries = size // ENTRY.size
+        self.random = Random(seed)
+
+    def close(self):
+        """Unmap and close the book file."""
+        if self.map:
+            self.map.close()
+        self.file.close()
+
+    def lookup(self, hash_):
+        """Return the (move, weight) entries of a position hash."""
+        low, high = 0, self.entries
+        while low < high:  # find the first entry of the hash
+            middle = (low + high) // 2
+            if ENTRY.unpack_from(self.map, middle * ENTRY.size)[0] < hash_:
+                low = middle + 1
+            else:
+                high = middle
+        found = []
+        for index in range(low, self.entries):
+            key, weight, move = ENTRY.unpack_from(self.map, index * ENTRY.size)
+            if key != hash_:
+                break
+            found.append((move, weight))
+        return found
+
+    def choose(self, position, best=False):
+        """Return a book move for a position, or None if it is not known.
+
+        @param best: take the heaviest move instead of a weighted choice
+        """
+        legal = set(position.generate_legal_moves())
+        # a move from another position of the same hash is not legal here
+        found = [(move, weight) for move, weight in
+                 self.lookup(position.hash) if move in legal]
+        if not found:
+            return None
+        if best:
+            return max(found, key=lambda entry: entry[1])[0]
+        return self.random.choices(
+            [move for move, _ in found], [weight for _, weight in found])[0]
+
+
+def main():
+    """Build an opening book from the command line."""
+    parser = ArgumentParser(description='Build an opening book from PGN.')
+    parser.add_argument('pgn', nargs='+', help='PGN files to read')
+    parser.add_argument('--output', default='book.bin')
+    parser.add_argument('--plies', type=int, default=MAX_PLY,
+                        help='plies of every game to take')
+    args = parser.parse_args()
+    time = perf_counter()
+    entries = build_book(args.pgn, args.output, args.plies)
+    print(f'entries {entries}  time {perf_counter() - time:.3f}s',
+          file=stderr)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,450 @@
+from argparse import ArgumentParser
+from collections import namedtuple
+from multiprocessing import Array, Event, Process, Queue
+from multiprocessing.shared_memory import SharedMemory
+from queue import Empty
+from time import perf_counter
+from weakref import finalize
+
+from book import OpeningBook
+from evaluate import evaluate, PIECE_VALUES
+from position import move_name, Position, START_FEN
+from tablebase import MAX_PIECES, Tablebases
+from transposition import BYTES_PER_BUCKET, EXACT, LOWER, \
+    TranspositionTable, UPPER
+
+
+MATE = 100000  # scores beyond MATE - MAX_PLY are mates in some plies
+MAX_PLY = 128
+# limits get checked every 256 nodes, a few hundredths of a second here
+CHECK_MASK = 255
+INFINITY = MATE + 1
+HELPER_TIMEOUT = 0.1  # seconds between checks on the helpers still awaited
+
+SearchResult = namedtuple('SearchResult', [
+    'move', 'score', 'depth', 'nodes', 'time', 'nps', 'pv'])
+
+
+class SearchStopped(Exception):
+    """Raised inside the search once a time or node limit is reached."""
+
+
+def score_to_table(score, ply):
+    """Make a mate score count from the node rather than from the root."""
+    if score >= MATE - MAX_PLY:
+        return score + ply
+    if score <= -MATE + MAX_PLY:
+        return score - ply
+    return score
+
+
+def score_from_table(score, ply):
+    """Make a mate score from the table count from the root again."""
+    if score >= MATE - MAX_PLY:
+        return score - ply
+    if score <= -MATE + MAX_PLY:
+        return score + ply
+    return score
+
+
+def _helper(index, memory, tasks, results, stop_event, node_counts):
+    """Search the tasks of a helper process until told to quit."""
+    engine = Engine(table=TranspositionTable(buffer=memory.buf))
+    engine.stop_event, engine.node_counts = stop_event, node_counts
+    engine.helper_index = index
+    for number, position, depth, time_limit, age in iter(tasks.get, None):
+        engine.table.age = age
+        # half of the helpers run an iteration ahead, so that the
+        # processes spread over different depths of the same tree
+        results.put((number, engine._iterate(
+            position, depth, time_limit, None, None, 2 if index % 2 else 1)))
+    engine.table.release()
+    memory.close()
+
+
+def _shut_down(processes, tasks, table, memory):
+    """Stop the helper processes and free the shared table."""
+    for process_tasks in tasks:
+        process_tasks.put(None)
+    for process in processes:
+        process.join(1)
+        if process.is_alive():
+            process.terminate()
+    table.release()
+    memory.close()
+    memory.unlink()
+
+
+class Engine:
+    """The class for an alpha-beta chess engine.
+
+    With several workers, helper processes search the same root position
+    as this one (Lazy SMP) and share its transposition table through
+    shared memory, so each process profits from what the others found.
+    """
+
+    def __init__(self, hash_mb=16, workers=1, table=None, book=None,
+                 tablebases=None):
+        """
+        @param hash_mb: megabytes of the transposition table
+        @param workers: processes to search with, this one included
+        @param table: a transposition table to use instead of a new one
+        @param book: an OpeningBook to take moves from without searching
+        @param tablebases: Tablebases to score endgames without searching
+        """
+        self.position = None
+        self.book = book
+        self.tablebases = tablebases
+        self.nodes = 0
+        self.node_limit = None
+        self.deadline = None
+        self.stopped = False
+        # set by the main process to stop helpers, or by another thread to
+        # stop a search of this one
+        self.stop_event = None
+        self.node_counts = None  # nodes searched by every helper
+        self.helper_index = None
+        self.helpers = []
+        self.search_number = 0  # tells the results of helpers apart
+        if table is not None:
+            self.table = table
+        elif workers > 1:
+            memory = SharedMemory(create=True, size=max(
+                1, hash_mb * 2 ** 20 // BYTES_PER_BUCKET) * BYTES_PER_BUCKET)
+            self.stop_event, self.results = Event(), Queue()
+            self.node_counts = Array('Q', workers - 1, lock=False)
+            self.tasks = [Queue() for _ in range(workers - 1)]
+            self.helpers = [Process(target=_helper, daemon=True, args=(
+                index, memory, self.tasks[index], self.results,
+                self.stop_event, self.node_counts))
+                for index in range(workers - 1)]
+            for process in self.helpers:
+                process.start()
+            # viewed only after the helpers start, so that forked helpers
+            # hold no views of their own to release
+            self.table = TranspositionTable(buffer=memory.buf)
+            self._finalizer = finalize(
+                self, _shut_down, self.helpers, self.tasks, self.table,
+                memory)
+        else:
+            self.table = TranspositionTable(hash_mb)
+        self.killers = [[0, 0] for _ in range(MAX_PLY)]
+        self.history = {}  # (piece, target) -> score of quiet cutoff moves
+        self.pv = [[] for _ in range(MAX_PLY + 1)]
+        self.root_best = None  # (score, pv) of the iteration going on
+
+    def stop(self):
+        """Ask a running search to stop as soon as possible."""
+        self.stopped = True
+
+    def close(self):
+        """Stop the helper processes and free the shared table, if any."""
+        if self.helpers:
+            self._finalizer()
+            self.helpers = []
+
+    def total_nodes(self):
+        """Return the nodes searched by this process and its helpers."""
+        if self.helpers:
+            return self.nodes + sum(self.node_counts)
+        return self.nodes
+
+    def evaluate(self):
+        """Evaluate the position, for the side to move."""
+        return evaluate(self.position)
+
+    def _check_limits(self):
+        """Stop the search when a time or node limit is reached."""
+        if self.helper_index is not None:  # report to the main process
+            self.node_counts[self.helper_index] = self.nodes
+        if self.stop_event is not None and self.stop_event.is_set():
+            self.stopped = True
+        if self.stopped or \
+                self.node_limit is not None and \
+                self.total_nodes() >= self.node_limit or \
+                self.deadline is not None and perf_counter() >= self.deadline:
+            self.stopped = True
+            raise SearchStopped
+
+    def _captured(self, move):
+        """Return the piece a move captures, or '00' if it is quiet."""
+        board = self.position.board
+        start, target = move & 63, move >> 6 & 63
+        if board[target] == '00' and board[start][1] == 'P' and \
+                start % 8 != target % 8:  # taking en passant
+            return 'bP' if board[start][0] == 'w' else 'wP'
+        return board[target]
+
+    def _order(self, moves, ply, best_move=0):
+        """Sort moves: the best known, captures, killers, then history."""
+        board = self.position.board
+        killers, history = self.killers[ply], self.history
+        scores = {}
+        for move in moves:
+            if move == best_move:
+                scores[move] = 1 << 30
+                continue
+            captured = self._captured(move)
+            if captured != '00' or move >> 12:
+                # most valuable victim, least valuable attacker
+                scores[move] = (1 << 20) + \
+                    PIECE_VALUES[captured[1] if captured != '00' else 'P'] \
+                    * 10 - PIECE_VALUES[board[move & 63][1]] // 10 + \
+                    (PIECE_VALUES['Q'] * 10 if move >> 12 & 7 == 1 else 0)
+            elif move == killers[0] or move == killers[1]:
+                scores[move] = 1 << 19
+            else:
+                scores[move] = history.get(
+                    (board[move & 63], move >> 6 & 63), 0)
+        moves.sort(key=scores.__getitem__, reverse=True)
+        return moves
+
+    def _quiescence(self, alpha, beta, ply):
+        """Search captures only, until the position is quiet."""
+        self.nodes += 1
+        if not self.nodes & CHECK_MASK:
+            self._check_limits()
+        if ply >= MAX_PLY:
+            return self.evaluate()
+        position = self.position
+        if position.is_attacked(position.turn):
+            # a king in check has to get out of it, standing pat is no option
+            moves = position.generate_legal_moves()
+            if not moves:
+                return -MATE + ply
+        else:
+            # the side to move may stand pat instead of capturing
+            stand_pat = self.evaluate()
+            if stand_pat >= beta:
+                return stand_pat
+            alpha = max(alpha, stand_pat)
+            moves = position.generate_legal_moves(captures_only=True)
+        for move in self._order(moves, ply):
+            undo = position.make_move(move)
+            try:
+                score = -self._quiescence(-beta, -alpha, ply + 1)
+            finally:
+                position.unmake_move(undo)
+            if score >= beta:
+                return score
+            alpha = max(alpha, score)
+        return alpha
+
+    def _negamax(self, depth, alpha, beta, ply):
+        """Search the position with alpha-beta pruning."""
+        position = self.position
+        self.pv[ply] = []
+        if ply and (position.repetitions[position.hash] > 1 or
+                    position.halfmove_clock >= 100):
+            return 0  # a repetition is as good as a draw inside the search
+        if ply and self.tablebases is not None and bin(
+                position.occupied['w'] | position.occupied['b']).count('1') \
+                <= MAX_PIECES:
+            found = self.tablebases.probe(position)
+            if found:  # tables know the exact distance to mate
+                outcome, plies = found
+                if outcome == 'draw':
+                    return 0
+                return MATE - ply - plies if outcome == 'win' else \
+                    -MATE + ply + plies
+        in_check = position.is_attacked(position.turn)
+        if in_check:  # search checks deeper, they are forcing
+            depth += 1
+        if depth <= 0 or ply >= MAX_PLY:
+            return self._quiescence(alpha, beta, ply)
+        self.nodes += 1
+        if not self.nodes & CHECK_MASK:
+            self._check_limits()
+
+        # a position searched at least as deep before may settle the node
+        best_move, original_alpha = 0, alpha
+        entry = self.table.probe(position.hash)
+        if entry:
+            best_move, score, entry_depth, bound = entry
+            score = score_from_table(score, ply)
+            if ply and entry_depth >= depth and (
+                    bound == EXACT or bound == LOWER and score >= beta or
+                    bound == UPPER and score <= alpha):
+                return score
+
+        moves = position.generate_legal_moves()
+        if not moves:
+            return -MATE + ply if in_check else 0
+        best_score = -INFINITY
+        for move in self._order(moves, ply, best_move):
+            undo = position.make_move(move)
+            try:
+                score = -self._negamax(depth - 1, -beta, -alpha, ply + 1)
+            finally:
+                position.unmake_move(undo)
+            if score > best_score:
+                best_score = score
+                if score > alpha:
+                    alpha, best_move = score, move
+                    self.pv[ply] = [move] + self.pv[ply + 1]
+                    if not ply:  # kept in case the iteration gets stopped
+                        self.root_best = score, self.pv[0][:]
+            if score >= beta:
+                if self._captured(move) == '00' and not move >> 12:
+                    # remember quiet moves that refute the opponent
+                    killers = self.killers[ply]
+                    if move != killers[0]:
+                        killers[0], killers[1] = move, killers[0]
+                    key = (position.board[move & 63], move >> 6 & 63)
+                    self.history[key] = \
+                        self.history.get(key, 0) + depth * depth
+                break
+        bound = UPPER if best_score <= original_alpha else \
+            LOWER if best_score >= beta else EXACT
+        # failing low tells no best move, the one stored before is kept
+        self.table.store(position.hash, best_move if bound != UPPER else 0,
+                         score_to_table(best_score, ply), depth, bound)
+        return best_score
+
+    def search(self, position, depth=MAX_PLY, time_limit=None,
+               node_limit=None, callback=None):
+        """Search the position by iterative deepening.
+
+        @param depth: the deepest iteration to search
+        @param time_limit: seconds after which the search stops
+        @param node_limit: nodes after which the search stops
+        @param callback: called with the SearchResult of every iteration
+        """
+        if self.book is not None:
+            move = self.book.choose(position)
+            if move is not None:  # known positions need no search
+                return SearchResult(move, 0, 0, 0, 0.0, 0, [move])
+        self.table.new_search()
+        if not self.helpers:
+            return self._iterate(position, depth, time_limit, node_limit,
+                                 callback)
+
+        for node_count in range(len(self.node_counts)):
+            self.node_counts[node_count] = 0
+        # a helper that died gets no more tasks, the others get numbered
+        # ones, so that a late result of an earlier search is told apart
+        self.search_number += 1
+        helpers = [index for index, process in enumerate(self.helpers)
+                   if process.is_alive()]
+        for index in helpers:
+            self.tasks[index].put((self.search_number, position, depth,
+                                   time_limit, self.table.age))
+        start_time = perf_counter()
+        result = self._iterate(position, depth, time_limit, node_limit,
+                               callback)
+        # the main search is done, so are the helpers
+        self.stop_event.set()
+        results = []
+        while len(results) < len(helpers):
+            try:
+                number, helper_result = self.results.get(
+                    timeout=HELPER_TIMEOUT)
+            except Empty:
+                if all(self.helpers[index].is_alive() for index in helpers):
+                    continue  # still winding down
+                break  # a helper died, whatever the rest found came by now
+            if number == self.search_number:
+                results.append(helper_result)
+        self.stop_event.clear()
+        for helper_result in results:
+            # a helper that got deeper knows better
+            if helper_result.depth > result.depth and helper_result.pv:
+                result = helper_result
+        elapsed = perf_counter() - start_time
+        nodes = self.nodes + sum(
+            helper_result.nodes for helper_result in results)
+        return result._replace(
+            nodes=nodes, time=elapsed,
+            nps=int(nodes / elapsed) if elapsed else 0)
+
+    def _iterate(self, position, depth, time_limit, node_limit, callback,
+                 start_depth=1):
+        """Deepen the search iteration by iteration."""
+        self.position = position
+        self.nodes, self.node_limit, self.stopped = 0, node_limit, False
+        start_time = perf_counter()
+        self.deadline = start_time + time_limit if time_limit else None
+        self.killers = [[0, 0] for _ in range(MAX_PLY)]
+
+        # with nothing searched at all, the likeliest move is the one the
+        # table knows, or else the best capture
+        entry = self.table.probe(position.hash)
+        moves = self._order(position.generate_legal_moves(), 0,
+                            entry[0] if entry else 0)
+        result = SearchResult(moves[0] if moves else None, 0, 0, 0, 0.0, 0,
+                              moves[:1])
+        for iteration in range(min(start_depth, depth),
+                               min(depth, MAX_PLY) + 1):
+            self.root_best = None
+            try:
+                score = self._negamax(iteration, -INFINITY, INFINITY, 0)
+            except SearchStopped:
+                if self.root_best is None:
+                    break
+                # root moves get searched best first, so a move fully
+                # searched in an unfinished iteration is as good as the
+                # last iteration's or better
+                score, pv = self.root_best
+                elapsed, nodes = perf_counter() - start_time, \
+                    self.total_nodes()
+                result = SearchResult(
+                    pv[0], score, iteration, nodes, elapsed,
+                    int(nodes / elapsed) if elapsed else 0, pv)
+                if callback:
+                    callback(result)
+                break
+            elapsed = perf_counter() - start_time
+            pv, nodes = self.pv[0][:], self.total_nodes()
+            result = SearchResult(
+                pv[0] if pv else result.move, score, iteration, nodes,
+                elapsed, int(nodes / elapsed) if elapsed else 0, pv)
+            if callback:
+                callback(result)
+            if not moves or abs(score) >= MATE - MAX_PLY or \
+                    self.deadline and \
+                    perf_counter() - start_time > time_limit / 2:
+                # the next iteration would hardly finish in time
+                break
+        return result
+
+
+def main():
+    """Search a position from the command line."""
+    parser = ArgumentParser(description='Search a chess position.')
+    parser.add_argument('--fen', default=START_FEN)
+    parser.add_argument('--depth', type=int, default=MAX_PLY)
+    parser.add_argument('--time', type=float, help='seconds to search')
+    parser.add_argument('--nodes', type=int)
+    parser.add_argument('--workers', type=int, default=1,
+                        help='processes to search with')
+    parser.add_argument('--hash', type=int, default=16,
+                        help='megabytes of the transposition table')
+    parser.add_argument('--book', help='an opening book file to consult')
+    parser.add_argument('--tablebases',
+                        help='a directory of endgame tables to consult')
+    args = parser.parse_args()
+    if args.depth == MAX_PLY and args.time is None and args.nodes is None:
+        args.depth = 5
+
+    def report(result):
+        """Print a line of search information."""
+        print(f'depth {result.depth}  score {result.score}  '
+              f'nodes {result.nodes}  nps {result.nps}  '
+              f'pv {" ".join(move_name(move) for move in result.pv)}')
+
+    book = OpeningBook(args.book) if args.book else None
+    tablebases = Tablebases(args.tablebases) if args.tablebases else None
+    engine = Engine(args.hash, args.workers, book=book,
+                    tablebases=tablebases)
+    result = engine.search(Position(args.fen), args.depth, args.time,
+                           args.nodes, report)
+    engine.close()
+    if book:
+        book.close()
+    if tablebases:
+        tablebases.close()
+    print('bestmove', move_name(result.move) if result.move else '(none)')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,284 @@
+from bitboard import bishop_attacks, KNIGHT_ATTACKS, rook_attacks
+
+
+PIECE_VALUES = {'P': 100, 'N': 320, 'B': 330, 'R': 500, 'Q': 900, 'K': 0}
+PHASE_WEIGHTS = {'P': 0, 'N': 1, 'B': 1, 'R': 2, 'Q': 4, 'K': 0}
+MAX_PHASE = 24  # all pieces on board -> middlegame, none -> endgame
+MOBILITY_WEIGHTS = {'N': 4, 'B': 5, 'R': 3, 'Q': 1}
+DOUBLED_PAWN = -15  # for every pawn beyond the first on a file
+ISOLATED_PAWN = -15
+PASSED_PAWN = [0, 90, 60, 40, 25, 15, 10, 0]  # by row from the eighth rank
+PAWN_SHIELD = 10  # for every pawn in front of a king, in the middlegame
+
+# piece-square tables seen by white, in the order of the board list
+# (a8, b8, ..., h1), black reads them mirrored
+PIECE_SQUARE_TABLES = {
+    'P': [0, 0, 0, 0, 0, 0, 0, 0,
+          50, 50, 50, 50, 50, 50, 50, 50,
+          10, 10, 20, 30, 30, 20, 10, 10,
+          5, 5, 10, 25, 25, 10, 5, 5,
+          0, 0, 0, 20, 20, 0, 0, 0,
+          5, -5, -10, 0, 0, -10, -5, 5,
+          5, 10, 10, -20, -20, 10, 10, 5,
+          0, 0, 0, 0, 0, 0, 0, 0],
+    'N': [-50, -40, -30, -30, -30, -30, -40, -50,
+          -40, -20, 0, 0, 0, 0, -20, -40,
+          -30, 0, 10, 15, 15, 10, 0, -30,
+          -30, 5, 15, 20, 20, 15, 5, -30,
+          -30, 0, 15, 20, 20, 15, 0, -30,
+          -30, 5, 10, 15, 15, 10, 5, -30,
+          -40, -20, 0, 5, 5, 0, -20, -40,
+          -50, -40, -30, -30, -30, -30, -40, -50],
+    'B': [-20, -10, -10, -10, -10, -10, -10, -20,
+          -10, 0, 0, 0, 0, 0, 0, -10,
+          -10, 0, 5, 10, 10, 5, 0, -10,
+          -10, 5, 5, 10, 10, 5, 5, -10,
+          -10, 0, 10, 10, 10, 10, 0, -10,
+          -10, 10, 10, 10, 10, 10, 10, -10,
+          -10, 5, 0, 0, 0, 0, 5, -10,
+          -20, -10, -10, -10, -10, -10, -10, -20],
+    'R': [0, 0, 0, 0, 0, 0, 0, 0,
+          5, 10, 10, 10, 10, 10, 10, 5,
+          -5, 0, 0, 0, 0, 0, 0, -5,
+          -5, 0, 0, 0, 0, 0, 0, -5,
+          -5, 0, 0, 0, 0, 0, 0, -5,
+          -5, 0, 0, 0, 0, 0, 0, -5,
+          -5, 0, 0, 0, 0, 0, 0, -5,
+          0, 0, 0, 5, 5, 0, 0, 0],
+    'Q': [-20, -10, -10, -5, -5, -10, -10, -20,
+          -10, 0, 0, 0, 0, 0, 0, -10,
+          -10, 0, 5, 5, 5, 5, 0, -10,
+          -5, 0, 5, 5, 5, 5, 0, -5,
+          0, 0, 5, 5, 5, 5, 0, -5,
+          -10, 5, 5, 5, 5, 5, 0, -10,
+          -10, 0, 5, 0, 0, 0, 0, -10,
+          -20, -10, -10, -5, -5, -10, -10, -20],
+    'K': [-30, -40, -40, -50, -50, -40, -40, -30,
+          -30, -40, -40, -50, -50, -40, -40, -30,
+          -30, -40, -40, -50, -50, -40, -40, -30,
+          -30, -40, -40, -50, -50, -40, -40, -30,
+          -20, -30, -30, -40, -40, -30, -30, -20,
+          -10, -20, -20, -20, -20, -20, -20, -10,
+          20, 20, 0, 0, 0, 0, 20, 20,
+          20, 30, 10, 0, 0, 10, 30, 20]
+}
+# in the endgame, pawns run for promotion and the king heads for the center
+ENDGAME_TABLES = dict(PIECE_SQUARE_TABLES, P=[
+    bonus for bonus in (0, 80, 50, 30, 15, 5, 0, 0) for _ in range(8)], K=[
+    -50, -40, -30, -20, -20, -30, -40, -50,
+    -30, -20, -10, 0, 0, -10, -20, -30,
+    -30, -10, 20, 30, 30, 20, -10, -30,
+    -30, -10, 30, 40, 40, 30, -10, -30,
+    -30, -10, 30, 40, 40, 30, -10, -30,
+    -30, -10, 20, 30, 30, 20, -10, -30,
+    -30, -30, 0, 0, 0, 0, -30, -30,
+    -50, -30, -30, -30, -30, -30, -30, -50])
+
+
+def _signed_tables(tables):
+    """Add piece values to tables, negated and mirrored for black."""
+    return {color + piece: [
+        (PIECE_VALUES[piece] + table[square if color == 'w' else square ^ 56])
+        * (1 if color == 'w' else -1) for square in range(64)]
+        for color in 'wb' for piece, table in tables.items()}
+
+
+# material and piece-square scores of every piece on every square, positive
+# for white, kept up to date by positions on every move
+MIDGAME_SCORES = _signed_tables(PIECE_SQUARE_TABLES)
+ENDGAME_SCORES = _signed_tables(ENDGAME_TABLES)
+
+FILES = [sum(1 << row * 8 + file for row in range(8)) for file in range(8)]
+ADJACENT_FILES = [(FILES[file - 1] if file else 0) |
+                  (FILES[file + 1] if file < 7 else 0) for file in range(8)]
+# squares in front of a pawn on its own and on the adjacent files, a pawn
+# with no enemy pawn there is passed
+PASSED_MASKS = {
+    'w': [(FILES[square % 8] | ADJACENT_FILES[square % 8]) &
+          ((1 << square // 8 * 8) - 1) for square in range(64)],
+    'b': [(FILES[square % 8] | ADJACENT_FILES[square % 8]) &
+          ~((1 << square // 8 * 8 + 8) - 1) for square in range(64)]
+}
+# the two rows in front of a king on its own side of the board
+SHIELD_MASKS = {
+    'w': [(FILES[square % 8] | ADJACENT_FILES[square % 8]) &
+          (0xFFFF << square // 8 * 8 - 16) if square // 8 >= 6 else 0
+          for square in range(64)],
+    'b': [(FILES[square % 8] | ADJACENT_FILES[square % 8]) &
+          (0xFFFF << square // 8 * 8 + 8) if square // 8 <= 1 else 0
+          for square in range(64)]
+}
+
+
+def _count(bitboard):
+    """Count the squares set in a bitboard."""
+    return bin(bitboard).count('1')
+
+
+def mobility(position):
+    """Score the squares knights and sliders reach, positive for white."""
+    bitboards, score = position.bitboards, 0
+    occupied = position.occupied['w'] | position.occupied['b']
+    for color, sign in (('w', 1), ('b', -1)):
+        free = ~position.occupied[color]
+        for piece, weight in MOBILITY_WEIGHTS.items():
+            pieces = bitboards[color + piece]
+            while pieces:
+                lowest = pieces & -pieces
+                square = lowest.bit_length() - 1
+                pieces ^= lowest
+                if piece == 'N':
+                    targets = KNIGHT_ATTACKS[square]
+                elif piece == 'B':
+                    targets = bishop_attacks(square, occupied)
+                elif piece == 'R':
+                    targets = rook_attacks(square, occupied)
+                else:
+                    targets = rook_attacks(square, occupied) | \
+                        bishop_attacks(square, occupied)
+                score += sign * weight * _count(targets & free)
+    return score
+
+
+def pawn_structure(position):
+    """Score doubled, isolated, and passed pawns, positive for white."""
+    score = 0
+    for color, enemy, sign in (('w', 'b', 1), ('b', 'w', -1)):
+        pawns = position.bitboards[color + 'P']
+        enemy_pawns = position.bitboards[enemy + 'P']
+        for file in range(8):
+            count = _count(pawns & FILES[file])
+            if count > 1:
+                score += sign * DOUBLED_PAWN * (count - 1)
+            if count and not pawns & ADJACENT_FILES[file]:
+                score += sign * ISOLATED_PAWN * count
+        while pawns:
+            lowest = pawns & -pawns
+            square = lowest.bit_length() - 1
+            pawns ^= lowest
+            if not PASSED_MASKS[color][square] & enemy_pawns:
+                score += sign * PASSED_PAWN[
+                    square // 8 if color == 'w' else 7 - square // 8]
+    return score
+
+
+def king_safety(position):
+    """Score the pawns sheltering each king, positive for white."""
+    bitboards = position.bitboards
+    return PAWN_SHIELD * (
+        _count(SHIELD_MASKS['w'][position.piece_coordinate['wK'][0]] &
+               bitboards['wP']) -
+        _count(SHIELD_MASKS['b'][position.piece_coordinate['bK'][0]] &
+               bitboards['bP']))
+
+
+def evaluate(position):
+    """Evaluate a position in centipawns, for the side to move."""
+    # the material and piece-square scores are kept up to date by the
+    # position itself, only the terms depending on several pieces are new
+    phase = min(position.phase, MAX_PHASE)
+    score = (position.midgame_score * phase +
+             position.endgame_score * (MAX_PHASE - phase)) // MAX_PHASE + \
+        mobility(position) + pawn_structure(position) + \
+        king_safety(position) * phase // MAX_PHASE
+    return score if position.turn == 'w' else -score
+
+
+_arrays = {}
+
+
+def _numpy_arrays(np):
+    """Build the NumPy arrays of the tables once."""
+    if not _arrays:
+        symbols = [color + piece for color in 'wb' for piece in 'PNBRQK']
+        _arrays['symbols'] = {symbol: index
+                              for index, symbol in enumerate(symbols)}
+        _arrays['midgame'] = np.array(
+            [MIDGAME_SCORES[symbol] for symbol in symbols], dtype=np.int64)
+        _arrays['endgame'] = np.array(
+            [ENDGAME_SCORES[symbol] for symbol in symbols], dtype=np.int64)
+        _arrays['phase'] = np.array(
+            [PHASE_WEIGHTS[symbol[1]] for symbol in symbols], dtype=np.int64)
+        _arrays['passed'] = np.array(PASSED_PAWN, dtype=np.int64)
+        _arrays['shield'] = {color: np.array(
+            [[mask >> square & 1 for square in range(64)]
+             for mask in SHIELD_MASKS[color]], dtype=bool)
+            for color in 'wb'}
+    return _arrays
+
+
+def evaluate_many(positions):
+    """Evaluate many positions at once with NumPy, for the side to move.
+
+    Returns an array of the scores evaluate() gives, one per position.
+    Mobility needs slider attacks, so it is still counted position by
+    position while the boards get gathered.
+    """
+    # imported here since only batch jobs need NumPy
+    import numpy as np
+
+    arrays = _numpy_arrays(np)
+    positions = list(positions)
+    count = len(positions)
+
+    # gather every piece into a (positions, symbols, squares) array
+    rows, symbols, squares = [], [], []
+    sides = np.empty(count, dtype=np.int64)
+    mobilities = np.empty(count, dtype=np.int64)
+    for row, position in enumerate(positions):
+        for symbol, coordinates in position.piece_coordinate.items():
+            rows.extend([row] * len(coordinates))
+            symbols.extend([arrays['symbols'][symbol]] * len(coordinates))
+            squares.extend(coordinates)
+        sides[row] = 1 if position.turn == 'w' else -1
+        mobilities[row] = mobility(position)
+    boards = np.zeros((count, 12, 64), dtype=np.int64)
+    boards[rows, symbols, squares] = 1
+
+    # material and piece-square tables, tapered by the game phase
+    midgame = np.einsum('nps,ps->n', boards, arrays['midgame'])
+    endgame = np.einsum('nps,ps->n', boards, arrays['endgame'])
+    phase = np.minimum(boards.sum(axis=2) @ arrays['phase'], MAX_PHASE)
+    score = (midgame * phase + endgame * (MAX_PHASE - phase)) // MAX_PHASE
+
+    # pawn structure from pawn counts by file and rows by square
+    white_pawns = boards[:, 0].reshape(count, 8, 8).astype(bool)
+    black_pawns = boards[:, 6].reshape(count, 8, 8).astype(bool)
+    for pawns, enemy_pawns, sign in ((white_pawns, black_pawns, 1),
+                                     (black_pawns, white_pawns, -1)):
+        files = pawns.sum(axis=1)
+        neighbours = np.zeros_like(files)
+        neighbours[:, 1:] += files[:, :-1]
+        neighbours[:, :-1] += files[:, 1:]
+        score += sign * (DOUBLED_PAWN * np.maximum(files - 1, 0).sum(axis=1) +
+                         ISOLATED_PAWN * (files * (neighbours == 0)).sum(
+                             axis=1))
+        # the row of the enemy pawn nearest to promotion on each file,
+        # widened to the adjacent files
+        rows_down = np.arange(8)[None, :, None]
+        if sign == 1:
+            nearest = np.where(enemy_pawns, rows_down, 8).min(axis=1)
+            padded = np.pad(nearest, ((0, 0), (1, 1)), constant_values=8)
+            blocking = np.minimum(np.minimum(padded[:, :-2], padded[:, 1:-1]),
+                                  padded[:, 2:])[:, None, :]
+            passed = pawns & (rows_down <= blocking)
+            bonus = arrays['passed'][np.arange(8)]
+        else:
+            nearest = np.where(enemy_pawns, rows_down, -1).max(axis=1)
+            padded = np.pad(nearest, ((0, 0), (1, 1)), constant_values=-1)
+            blocking = np.maximum(np.maximum(padded[:, :-2], padded[:, 1:-1]),
+                                  padded[:, 2:])[:, None, :]
+            passed = pawns & (rows_down >= blocking)
+            bonus = arrays['passed'][7 - np.arange(8)]
+        score += sign * (passed.sum(axis=2) @ bonus)
+
+    # pawns sheltering the kings, weighed by the game phase
+    white_kings = boards[:, 5].argmax(axis=1)
+    black_kings = boards[:, 11].argmax(axis=1)
+    shield = (arrays['shield']['w'][white_kings] &
+              white_pawns.reshape(count, 64)).sum(axis=1) - \
+        (arrays['shield']['b'][black_kings] &
+         black_pawns.reshape(count, 64)).sum(axis=1)
+    score += PAWN_SHIELD * shield * phase // MAX_PHASE
+
+    return (score + mobilities) * sides
@@ -1,9 +1,21 @@
-from copy import deepcopy
+from collections import OrderedDict
+from os import path
+
 import pygame
-from prep import Log, prep, Setup
+from analysis import Analysis, white_share
+from book import OpeningBook
+from compact import CompactPosition
+from gamelog import Log
+from pgn import today, write_game
+from position import decode_move, encode_move, Position
+from prep import prep
 
 
-FPS = 30
+IDLE_TIMEOUT = 1000  # milliseconds to wait for an event when idle
+# posted from other threads to wake up the loop, such as an engine with news
+WAKE_UP = pygame.USEREVENT
+PGN_FILE = 'games.pgn'  # games saved with the S key get appended here
+BOOK_FILE = 'book.bin'  # an opening book for the B key, made by book.py
 
 # SIZE CONSTANTS
 WINDOW_WIDTH = 800
@@ -15,6 +27,13 @@ SQUARE_HEIGHT = WINDOW_HEIGHT // 8
 PIECE_SIZE = BOARD_WIDTH // 9
 NOTATION_SIZE = BOARD_WIDTH // 50
 SIDEBAR_LOG_LINE_SPACING = WINDOW_HEIGHT // 32
+NOTATION_GLYPHS = 512  # rendered notation strings kept for reuse
+SNAPSHOT_INTERVAL = 16  # plies between position snapshots for rewinding
+EVAL_BAR_WIDTH = SIDEBAR_WIDTH // 32
+# the evaluation bar sits on the sidebar, right of the line along the board
+EVAL_BAR_AREA = (BOARD_WIDTH + WINDOW_WIDTH // 250, 0, EVAL_BAR_WIDTH,
+                 WINDOW_HEIGHT)
+ARROW_WIDTH = SQUARE_WIDTH // 8
 
 # COLOR TUPLES
 BLACK = (0, 0, 0)
@@ -26,23 +45,50 @@ IN_CHECK_HIGHLIGHT = (255, 100, 130)
 PIECE_SELECTED_HIGHLIGHT = (200, 200, 255)
 LEGAL_SQUARE_HIGHLIGHT = (100, 190, 150)
 RIGHT_CLICK_HIGHLIGHT = (220, 80, 20)
+EVAL_BAR_WHITE = (240, 240, 240)
+EVAL_BAR_BLACK = (40, 40, 40)
+ARROW_COLOR = (30, 120, 60)
+
+
+def open_book():
+    """Open the opening book for the B key, None if there is none."""
+    return OpeningBook(BOOK_FILE) if path.exists(BOOK_FILE) else None
 
 
-class Game(Setup, Log):
-    """The class for chess games."""
+class Game(Log):
+    """The class for chess games, rendering a headless position."""
 
     result = []
 
-    def __init__(self):
-        Setup.__init__(self)
+    def __init__(self, book=None):
+        """
+        @param book: an OpeningBook for the B key, left open for the caller
+                     to close, as games after this one may play from it too
+        """
         Log.__init__(self)
+        self.position = Position()
         self.move = []
-        self.promote = None
+        self.promote = None  # a pawn move waiting for the promotion choice
         self.promotion_choices = []
 
         self.highlights = []
-        self.rewind_dict = {}
-        self.castle_flags_for_undoes = {'w': {}, 'b': {}}
+        # what each square shows on the screen and what it should show after
+        # the next render, as (color, piece) pairs, only the differences get
+        # repainted
+        self.shown = [None] * 64
+        self.wanted = [None] * 64
+        self.dirty_rects = []  # areas drawn outside of the squares
+        # the best-move arrow as (start, target) and the white share of the
+        # evaluation bar, wanted and shown, the same way as the squares
+        self.arrow = self.shown_arrow = None
+        self.bar = self.shown_bar = None
+        self.analysis = None  # an Analysis while the A key has it on
+        self.undoes = []  # information to unmake the moves made
+        # compact positions after every SNAPSHOT_INTERVAL plies, so rewinding
+        # to any ply replays less than SNAPSHOT_INTERVAL moves
+        self.snapshots = [CompactPosition.from_position(self.position)]
+        self.ply = None  # the ply shown while rewinding, None otherwise
+        self.game_position = None  # the current position while rewinding
 
         self.chess_font = pygame.font.Font('chess_font.ttf', PIECE_SIZE)
         self.notation_font = pygame.font.Font('chess_font.ttf', NOTATION_SIZE)
@@ -50,9 +96,19 @@ class Game(Setup, Log):
                              'wB': '\u2657', 'wQ': '\u2655', 'wK': '\u2654',
                              'bP': '\u265F', 'bR': '\u265C', 'bN': '\u265E',
                              'bB': '\u265D', 'bQ': '\u265B', 'bK': '\u265A'}
+        # every piece rendered once, with its offset centering it on a square
+        self.piece_glyphs = {}
+        for piece, symbol in self.piece_symbol.items():
+            glyph = self.chess_font.render(symbol, True, BLACK)
+            self.piece_glyphs[piece] = (
+                glyph, ((SQUARE_WIDTH - glyph.get_width()) // 2,
+                        (SQUARE_HEIGHT - glyph.get_height()) // 2))
+        # notation rendered when first shown, the least recently used goes
+        self.notation_glyphs = OrderedDict()
+
+        self.book = book
 
         self.window = pygame.display.set_mode((WINDOW_WIDTH, WINDOW_HEIGHT))
-        self.clock = pygame.time.Clock()
 
     @staticmethod
     def get_area(square):
@@ -66,221 +122,225 @@ class Game(Setup, Log):
         return (pygame.mouse.get_pos()[0] // SQUARE_WIDTH +
                 pygame.mouse.get_pos()[1] // SQUARE_HEIGHT * 8)
 
-    def update_en_passant(self, start, target):
-        """Update the en passant status for the game."""
-        if self.en_passant:
-            # capture the enemy pawn
-            if self.board[start] == 'wP':
-                if target + 8 == self.en_passant:
-                    self.piece_coordinate['bP'].remove(target + 8)
-                    self.board[target + 8] = '00'
-            elif self.board[start] == 'bP':
-                if target - 8 == self.en_passant:
-                    self.piece_coordinate['wP'].remove(target - 8)
-                    self.board[target - 8] = '00'
-
-        # en passant capture must be made on the very next turn
-        self.en_passant = None
-
-        # check if a pawn moves forward two squares
-        if abs(start - target) == 16 and (self.board[start][1] == 'P'):
-            self.en_passant = target
-
-    def update_castle(self, start, target):
-        """Update the castle status for the game."""
-        if self.board[start][1] == 'K':
-            if target == start + 2:  # if short castled
-                # reposition the rook after castling
-                self.piece_coordinate[self.turn + 'R'].remove(start + 3)
-                self.piece_coordinate[self.turn + 'R'].append(start + 1)
-                self.board[start + 3] = '00'
-                self.board[start + 1] = self.turn + 'R'
-            elif target == start - 2:  # if long castled
-                # reposition the rook after castling
-                self.piece_coordinate[self.turn + 'R'].remove(start - 4)
-                self.piece_coordinate[self.turn + 'R'].append(start - 1)
-                self.board[start - 4] = '00'
-                self.board[start - 1] = self.turn + 'R'
-
-            # save the current castle flags in case of undoing castling
-            self.castle_flags_for_undoes[self.turn][str(len(
-                self.game_log))] = deepcopy(self.castle_flags[self.turn])
-            # can't castle if the king has previously moved
-            self.castle_flags[self.turn]['short'] = False
-            self.castle_flags[self.turn]['long'] = False
-
-        # check if the rook involved has moved or got captured
-        if start in {0, 7, 56, 63} or target in {0, 7, 56, 63}:
-            # save the current castle flags in case of undoing castling
-            self.castle_flags_for_undoes[self.turn][str(len(
-                self.game_log))] = deepcopy(self.castle_flags[self.turn])
-            if start == 0 or target == 0:
-                self.castle_flags['b']['long'] = False
-            if start == 7 or target == 7:
-                self.castle_flags['b']['short'] = False
-            if start == 56 or target == 56:
-                self.castle_flags['w']['long'] = False
-            if start == 63 or target == 63:
-                self.castle_flags['w']['short'] = False
-
-    def update_pawn_promotion(self, target, symbol=''):
-        """Update the pawn promotion status for the game."""
-        if symbol:  # update pawn promotions
-            self.piece_coordinate[self.board[target]].remove(target)
-            self.piece_coordinate[symbol].append(target)
-            self.board[target] = symbol
-            # update the promote information to the logs
-            self.game_log[-1] += '=' + symbol
-            self.san[-1] += '=' + symbol[1]
-            self.promote = None
-        for square in range(8):
-            # check if one of the white pawns gets to eighth rank
-            if self.board[square] == 'wP':
-                self.promote = square
-                break
-            # check if one of the black pawns gets to first rank
-            elif self.board[square + 56] == 'bP':
-                self.promote = square + 56
-                break
-
-    def update_game_result(self):
-        """Determine the result of chess games."""
-        # check whether there are any legal moves
-        verifying_squares = []
-        for symbol in self.piece_coordinate:
-            if symbol[0] == self.turn:
-                verifying_squares.extend(self.piece_coordinate[symbol])
-        for square in verifying_squares:
-            if self.legal(square):
-                break
-        else:
-            # determine whether the king gets checkmated or stalemated
-            if self.is_attacked(self.board, self.turn):
-                victor = 'black' if self.turn == 'w' else 'white'
-                Game.result = [victor + ' wins', 'by checkmate']
-                return
-            else:
-                Game.result = ['draw', 'by stalemate']
-                return
-
-        # check the possibility of checkmate
-        if len(self.piece_coordinate['wB']) + \
-                len(self.piece_coordinate['wN']) <= 1 and \
-                len(self.piece_coordinate['bB']) + \
-                len(self.piece_coordinate['bN']) <= 1:
-            for symbol in self.piece_coordinate:
-                if symbol[1] != 'B' and symbol[1] != 'N' and \
-                        symbol[1] != 'K' and self.piece_coordinate[symbol]:
-                    break
-            else:
-                Game.result = ['draw', 'insufficient material']
-                return
-
-        # check fifty-move rule and repetition
-        move_count, repetition_count = 0, 0
-        check_dict = {'turn': self.turn, 'board': self.board[:],
-                      'piece_coordinate': deepcopy(self.piece_coordinate)}
-        while True:
-            if not self.game_log or self.game_log[-1][1] == 'P' or \
-                    self.game_log[-1][-3] == 'x' or \
-                    self.game_log[-1][-6] == 'x':
-                self.game_log += self.temp_log
-                self.temp_log.clear()
-                break
-            move_count += 1
-            check_dict['turn'] = self.update_position(check_dict, 'last')
-            if check_dict['piece_coordinate'] == self.piece_coordinate:
-                repetition_count += 1
-            if repetition_count == 2:
-                Game.result = ['draw', 'repetition']
-                return
-            if move_count == 99:
-                Game.result = ['draw', 'fifty-move rule']
-                return
-
     def update_game(self, start, target, symbol=''):
-        """Update the chess board and game elements."""
-        identical_piece = []
-        # look for pieces that share the same piece type with board[start]
-        # and are also able to get to the target square
-        for square in self.piece_coordinate[self.board[start]]:
-            if target in self.legal(square):
-                identical_piece.append(square)
-        self.track_the_game(self.board, start, target, identical_piece)
-        self.update_en_passant(start, target)
-        if self.castle_flags[self.turn]['short'] or \
-                self.castle_flags[self.turn]['long']:
-            self.update_castle(start, target)
-        # update the pieces coordinates set
-        self.piece_coordinate[self.board[start]].remove(start)
-        self.piece_coordinate[self.board[start]].append(target)
-        if self.board[target] != '00':  # whether it's a capture
-            self.piece_coordinate[self.board[target]].remove(target)
-        # update chess board
-        self.board[target] = self.board[start]
-        self.board[start] = '00'
-        # update the player turn
-        self.turn = 'b' if self.turn == 'w' else 'w'
-        self.update_pawn_promotion(target)
-        self.update_game_result()
+        """Update the chess position and game elements."""
+        move = encode_move(start, target, symbol[1:])
+        # the log entry needs the position from before the move
+        self.track_the_game(self.position, move)
+        self.undoes.append(self.position.make_move(move))
+        if len(self.undoes) % SNAPSHOT_INTERVAL == 0:
+            self.snapshots.append(CompactPosition.from_position(self.position))
+        Game.result = self.position.result() or []
+        self.analyse()
+
+    def rewind(self, ply):
+        """Show the position after a ply of the game, the last for the current.
+
+        The position gets rebuilt from the snapshot before the ply, so a jump
+        anywhere in the game replays less than SNAPSHOT_INTERVAL moves, and
+        the game position and its log stay untouched.
+        """
+        if not 0 <= ply <= len(self.game_log):
+            return
+        if ply == len(self.game_log):  # back to the current position
+            if self.ply is not None:
+                self.position, self.game_position = self.game_position, None
+                self.ply = None
+        else:
+            if self.ply is None:
+                self.game_position = self.position
+            position = self.snapshots[ply // SNAPSHOT_INTERVAL].to_position()
+            for entry in self.game_log[
+                    ply - ply % SNAPSHOT_INTERVAL:ply]:
+                position.make_move(entry & 0x7FFF)
+            self.position, self.ply = position, ply
+        self.draw_board()
+        if self.promote and self.ply is None:
+            self.draw_promotion_prompt()
+        self.analyse()
+
+    def analyse(self):
+        """Restart the analysis on the position shown, if it is on."""
+        if self.analysis is not None:
+            self.analysis.start([entry & 0x7FFF for entry in self.game_log[
+                :len(self.game_log) if self.ply is None else self.ply]])
+            self.arrow = None  # the old arrow belongs to another position
+
+    def toggle_analysis(self):
+        """Turn the engine analysis on or off."""
+        if self.analysis is None:
+            self.analysis = Analysis(notify=lambda: pygame.event.post(
+                pygame.event.Event(WAKE_UP)))
+            self.analyse()
+        else:
+            self.close_analysis()
+
+    def close_analysis(self):
+        """Stop the analysis and take its arrow and bar off the screen."""
+        if self.analysis is not None:
+            self.analysis.close()
+            self.analysis = None
+        self.arrow = self.bar = None
+
+    def show_analysis(self):
+        """Take the latest analysis news to the arrow and the bar."""
+        if self.analysis is None:
+            return
+        latest = self.analysis.latest()
+        if latest is None:  # the bar stays until the new position has news
+            self.arrow = None
+            return
+        score, move, _ = latest
+        self.bar = white_share(score)
+        self.arrow = (move & 63, move >> 6 & 63) if move is not None \
+            else None
+
+    def wait_events(self):
+        """Return the events that arrive, waiting for them when idle.
+
+        An idle window blocks in pygame.event.wait(), taking no CPU until
+        input, a timer, or a WAKE_UP event comes.
+        """
+        event = pygame.event.wait(IDLE_TIMEOUT)
+        if event.type == pygame.NOEVENT:  # timed out
+            return []
+        return [event] + pygame.event.get()
 
     def draw_piece(self, piece, square):
         """Draw chess piece on the specific square."""
-        symbol = self.piece_symbol[piece]
-        area = list(self.get_area(square))[:2]
-        for area_index in range(2):  # center the piece symbol
-            square_size = (SQUARE_WIDTH, SQUARE_HEIGHT)
-            area[area_index] += (square_size[area_index] -
-                                 self.chess_font.size(symbol)[area_index]) // 2
-        self.window.blit(self.chess_font.render(symbol, True, BLACK), area)
-
-    def draw_highlight(self, square, color, board=None):
+        glyph, (x_offset, y_offset) = self.piece_glyphs[piece]
+        self.window.blit(glyph, (SQUARE_WIDTH * (square % 8) + x_offset,
+                                 SQUARE_HEIGHT * (square // 8) + y_offset))
+
+    def notation_glyph(self, text):
+        """Return the rendered notation text, rendering it only once."""
+        glyph = self.notation_glyphs.get(text)
+        if glyph is None:
+            glyph = self.notation_font.render(text, True, BLACK)
+            self.notation_glyphs[text] = glyph
+            if len(self.notation_glyphs) > NOTATION_GLYPHS:
+                self.notation_glyphs.popitem(last=False)
+        else:
+            self.notation_glyphs.move_to_end(text)
+        return glyph
+
+    def draw_highlight(self, square, color):
         """Highlight the specific square."""
-        board = board or self.board
-        pygame.draw.rect(self.window, color, self.get_area(square))
-        if board[square] != '00':
-            self.draw_piece(board[square], square)
+        self.wanted[square] = (color, self.position.board[square])
 
-    def draw_board(self, turn=None, board=None, piece_coordinate=None):
+    def draw_board(self):
         """Draw the chess board and pieces."""
-        turn, board = turn or self.turn, board or self.board
-        piece_coordinate = piece_coordinate or self.piece_coordinate
+        turn, board = self.position.turn, self.position.board
         colors = [LIGHT_SQUARE, DARK_SQUARE]
         for square in range(64):
             if (square // 8) % 2 == 0:  # first squares on odd ranks are light
                 color = colors[square % 2]
             else:  # first squares on even ranks are dark
                 color = colors[(square + 1) % 2]
-            pygame.draw.rect(self.window, color, self.get_area(square))
-        for symbol, squares in piece_coordinate.items():
-            for square in squares:
-                self.draw_piece(symbol, square)
+            self.wanted[square] = (color, board[square])
 
         # highlight checks
-        king_square = piece_coordinate[turn + 'K'][0]
-        if self.is_attacked(board, turn, king_square):
-            self.draw_highlight(king_square, IN_CHECK_HIGHLIGHT, board=board)
+        king_square = self.position.piece_coordinate[turn + 'K'][0]
+        if self.position.is_attacked(turn, king_square):
+            self.draw_highlight(king_square, IN_CHECK_HIGHLIGHT)
+
+    @staticmethod
+    def arrow_squares(arrow):
+        """Return the squares an arrow may cover."""
+        if arrow is None:
+            return []
+        (start_row, start_file), (target_row, target_file) = \
+            divmod(arrow[0], 8), divmod(arrow[1], 8)
+        return [row * 8 + file for row in range(
+            min(start_row, target_row), max(start_row, target_row) + 1)
+            for file in range(min(start_file, target_file),
+                              max(start_file, target_file) + 1)]
+
+    def draw_arrow(self, start, target):
+        """Draw an arrow between the centers of two squares."""
+        x_start, y_start, _, _ = self.get_area(start)
+        x_target, y_target, _, _ = self.get_area(target)
+        x_start += SQUARE_WIDTH // 2
+        y_start += SQUARE_HEIGHT // 2
+        x_target += SQUARE_WIDTH // 2
+        y_target += SQUARE_HEIGHT // 2
+        length = max(1, ((x_target - x_start) ** 2 +
+                         (y_target - y_start) ** 2) ** 0.5)
+        # unit vectors along and across the arrow for its head
+        x_along, y_along = (x_target - x_start) / length, \
+            (y_target - y_start) / length
+        x_across, y_across = -y_along, x_along
+        head = ARROW_WIDTH * 2
+        x_base, y_base = x_target - x_along * head * 1.5, \
+            y_target - y_along * head * 1.5
+        area = pygame.draw.line(self.window, ARROW_COLOR, (x_start, y_start),
+                                (x_base, y_base), ARROW_WIDTH)
+        return area.union(pygame.draw.polygon(self.window, ARROW_COLOR, (
+            (x_target, y_target),
+            (x_base + x_across * head, y_base + y_across * head),
+            (x_base - x_across * head, y_base - y_across * head))))
+
+    def draw_eval_bar(self):
+        """Draw the evaluation bar, white's share growing from the bottom."""
+        if self.bar is None:
+            return pygame.draw.rect(self.window, SIDEBAR_COLOR, EVAL_BAR_AREA)
+        x_position, _, width, height = EVAL_BAR_AREA
+        white = round(height * self.bar)
+        pygame.draw.rect(self.window, EVAL_BAR_BLACK,
+                         (x_position, 0, width, height - white))
+        pygame.draw.rect(self.window, EVAL_BAR_WHITE,
+                         (x_position, height - white, width, white))
+        return pygame.Rect(EVAL_BAR_AREA)
+
+    def render(self):
+        """Repaint the squares that changed and update only what got drawn."""
+        rects = self.dirty_rects
+        arrow_squares = self.arrow_squares(self.arrow)
+        if self.arrow != self.shown_arrow:
+            # squares under the old arrow get repainted, and so do the ones
+            # under the new arrow, drawn over them afterwards
+            for square in self.arrow_squares(self.shown_arrow) + \
+                    arrow_squares:
+                self.shown[square] = None
+            self.shown_arrow = self.arrow
+        under_arrow = False  # whether the arrow needs drawing again
+        for square, wanted in enumerate(self.wanted):
+            if wanted != self.shown[square]:
+                color, piece = wanted
+                rects.append(pygame.draw.rect(self.window, color,
+                                              self.get_area(square)))
+                if piece != '00':
+                    self.draw_piece(piece, square)
+                self.shown[square] = wanted
+                under_arrow = under_arrow or square in arrow_squares
+        if under_arrow:
+            rects.append(self.draw_arrow(*self.arrow))
+        if self.bar != self.shown_bar:
+            rects.append(self.draw_eval_bar())
+            self.shown_bar = self.bar
+        if rects:  # nothing changed, nothing to update
+            pygame.display.update(rects)
+            self.dirty_rects = []
 
     def draw_promotion_prompt(self):
         """Draw a window for pawn promotion prompt."""
-        if isinstance(self.promote, int):
-            promote_window = pygame.Surface((SQUARE_WIDTH, WINDOW_HEIGHT // 2))
-            promote_window.fill(BACKGROUND_COLOR)
-            square = self.promote
-            if self.board[self.promote] == 'wP':  # white pawn promotion prompt
+        if self.promote:
+            square = self.promote[1]
+            if self.position.turn == 'w':  # white pawn promotion prompt
                 self.promotion_choices = ['wQ', 'wB', 'wN', 'wR']
             else:  # black pawn promotion prompt
                 square -= 24
                 self.promotion_choices = ['bR', 'bN', 'bB', 'bQ']
-            self.window.blit(promote_window, self.get_area(square)[:2])
+            # the prompt covers the four squares below or above the target
             for index, symbol in enumerate(self.promotion_choices):
-                self.draw_piece(symbol, square + 8 * index)
+                self.wanted[square + 8 * index] = (BACKGROUND_COLOR, symbol)
 
     def draw_sidebar(self):
         """Draw a sidebar for logs in standard algebraic notations."""
         sidebar = pygame.Surface((SIDEBAR_WIDTH, WINDOW_HEIGHT))
         sidebar.fill(SIDEBAR_COLOR)
-        self.window.blit(sidebar, (BOARD_WIDTH, 0))
+        self.dirty_rects.append(self.window.blit(sidebar, (BOARD_WIDTH, 0)))
+        self.shown_bar = None  # the bar got covered up as well
         pygame.draw.line(self.window, BLACK, (BOARD_WIDTH, 0),
                          (BOARD_WIDTH, WINDOW_HEIGHT), (WINDOW_WIDTH // 250))
 
@@ -300,35 +360,39 @@ class Game(Setup, Log):
         # neatly format the move log for the sidebar
         if move[0].isupper() and move[0] != 'O':  # if not a pawn move or
             # castling, display the piece notation in figurines for the sidebar
-            for symbol in self.piece_symbol:
-                if turn + move[0] == symbol:
-                    move = self.piece_symbol[symbol] + move[1:]
-        elif move[-2] == '=':  # if a pawn gets promoted, display the notation
-            # of the piece it promoted to in figurines for the sidebar
-            for symbol in self.piece_symbol:
-                if turn + move[-1] == symbol:
-                    move = move[:-1] + self.piece_symbol[symbol]
+            move = self.piece_symbol[turn + move[0]] + move[1:]
+        elif '=' in move:  # if a pawn gets promoted, display the notation
+            # of the piece it promoted to in figurines for the sidebar, the
+            # notation may still end with a check or checkmate sign
+            index = move.index('=') + 1
+            move = move[:index] + self.piece_symbol[turn + move[index]] + \
+                move[index + 1:]
 
         # display a certain move on the sidebar
         display_object = str(move_count) + '. ' if turn == 'w' else ''
-        self.window.blit(self.notation_font.render(
-            display_object + move, True, BLACK), (x_position, y_position))
+        self.dirty_rects.append(self.window.blit(self.notation_glyph(
+            display_object + move), (x_position, y_position)))
 
     def make_move(self):
         """Make chess move based on click inputs."""
         square = self.get_square()
         if not self.move:  # handles the start square of a chess move
-            if self.board[square][0] == self.turn:
+            if self.position.board[square][0] == self.position.turn:
                 self.move.append(square)
                 self.draw_highlight(self.move[0], PIECE_SELECTED_HIGHLIGHT)
-                for square in self.legal(self.move[0]):
+                for square in self.position.legal(self.move[0]):
                     self.draw_highlight(square, LEGAL_SQUARE_HIGHLIGHT)
                 return
         else:  # handles the target square of a chess move
             self.move.append(square)
-            if self.move[1] in self.legal(self.move[0]):
-                self.update_game(self.move[0], self.move[1])
-                self.update_sidebar(self.san[-1], len(self.san))
+            if self.move[1] in self.position.legal(self.move[0]):
+                if self.position.board[self.move[0]][1] == 'P' and \
+                        self.move[1] // 8 in (0, 7):
+                    # the move is made once a promotion choice is taken
+                    self.promote = self.move[:]
+                else:
+                    self.update_game(self.move[0], self.move[1])
+                    self.update_sidebar(self.san[-1], len(self.san))
         self.draw_board()
         self.draw_promotion_prompt()
         self.move.clear()
@@ -336,53 +400,47 @@ class Game(Setup, Log):
     def pawn_promotion(self):
         """Handle pawn promotions."""
         square, symbol = self.get_square(), ''
-        if self.board[self.promote] == 'wP':  # handles white pawn promotions
-            if square % 8 == self.promote and square // 8 <= 3:
+        start, target = self.promote
+        if self.position.turn == 'w':  # handles white pawn promotions
+            if square % 8 == target and square // 8 <= 3:
                 symbol = self.promotion_choices[square // 8]
         else:  # handles black pawn promotions
-            if square % 8 == self.promote - 56 and square // 8 >= 4:
+            if square % 8 == target - 56 and square // 8 >= 4:
                 symbol = self.promotion_choices[square // 8 - 4]
-        self.update_pawn_promotion(self.promote, symbol)
-        self.update_game_result()
+        if not symbol:  # keep prompting until a promotion choice is taken
+            self.draw_promotion_prompt()
+            return
+        self.promote = None
+        self.update_game(start, target, symbol)
         self.draw_board()
         self.update_sidebar(self.san[-1], len(self.san))
 
     def undo_move(self):
         """Undo chess move."""
-        if not self.game_log or self.temp_log or self.promote:
-            # if not self.game_log:
+        if not self.undoes or self.ply is not None or self.promote:
+            # if not self.undoes:
             # undoing move at the start position is inhibited
-            # if self.temp_log:
+            # if self.ply is not None:
             # undoing move while rewinding previous positions is inhibited
             # if self.promote:
             # undoing move while promoting is inhibited
             return
-        if self.rewind_dict:
-            self.rewind_dict.clear()
-        self.turn = self.update_position(
-            {'turn': self.turn, 'board': self.board,
-             'piece_coordinate': self.piece_coordinate}, 'last')
-        # check whether the undo move is en passant
-        if self.temp_log[0][-3] == 'E':
-            # reset the en passant flag after undoing an en passant move
-            direction = 1 if self.turn == 'w' else -1
-            self.en_passant = int(self.temp_log[0][4:6]) + 8 * direction
-        # check whether the undo move is castling
-        if str(move_count := len(self.game_log) + 1) in self. \
-                castle_flags_for_undoes[self.turn]:
-            # reset the corresponding castle flags
-            self.castle_flags[self.turn] = deepcopy(
-                self.castle_flags_for_undoes[self.turn].pop(str(move_count)))
-        self.temp_log.clear()
+        if len(self.undoes) % SNAPSHOT_INTERVAL == 0:
+            self.snapshots.pop()  # the snapshot after the undone move
+        self.position.unmake_move(self.undoes.pop())
+        self.take_back()
+        self.analyse()
+        move_count = len(self.game_log) + 1
         # cover up the undone move on the sidebar
         x_position = BOARD_WIDTH + SIDEBAR_WIDTH // 20 if \
-            self.turn == 'w' else BOARD_WIDTH + SIDEBAR_WIDTH // 2
+            self.position.turn == 'w' else BOARD_WIDTH + SIDEBAR_WIDTH // 2
         y_position = (move_count % 30 if move_count % 30 != 0 or
                       move_count == 0 else 30) * SIDEBAR_LOG_LINE_SPACING
         cover_up = pygame.Surface((SIDEBAR_WIDTH, WINDOW_HEIGHT))
         cover_up.fill(SIDEBAR_COLOR)
-        self.window.blit(cover_up, (x_position, y_position))
-        self.san.pop()
+        self.dirty_rects.append(
+            self.window.blit(cover_up, (x_position, y_position)))
+        # the san view follows the popped game log
         if len(self.san) % 60 == 0:  # if the sidebar is empty after covering
             # up and the current game logs are on the last sidebar page, draw
             # the least-thirty-move log
@@ -390,6 +448,27 @@ class Game(Setup, Log):
                 self.update_sidebar(move, length)
         self.draw_board()
 
+    def save_game(self):
+        """Append the game to the PGN file."""
+        # rewinding leaves the log alone, it always holds the whole game
+        moves = [entry & 0x7FFF for entry in self.game_log]
+        with open(PGN_FILE, 'a', encoding='utf-8') as file:
+            file.write(write_game(moves, {'Event': 'Casual game',
+                                          'Date': today()}) + '\n')
+
+    def play_book_move(self):
+        """Play a move from the opening book, if it knows the position."""
+        if self.book is None or self.ply is not None or self.promote:
+            return
+        move = self.book.choose(self.position)
+        if move is None:
+            return
+        start, target, promotion = decode_move(move)
+        self.update_game(start, target,
+                         self.position.turn + promotion if promotion else '')
+        self.draw_board()
+        self.update_sidebar(self.san[-1], len(self.san))
+
     def mouse_click(self, event):
         """Handle mouse clicks."""
         if pygame.mouse.get_pos()[0] >= BOARD_WIDTH:
@@ -408,31 +487,40 @@ class Game(Setup, Log):
             for square in self.highlights:
                 self.draw_highlight(square, RIGHT_CLICK_HIGHLIGHT)
 
+    def sidebar_click(self):
+        """Jump to the position after the move clicked on the sidebar."""
+        x_position, y_position = pygame.mouse.get_pos()
+        line = y_position // SIDEBAR_LOG_LINE_SPACING
+        if not 1 <= line <= 30:  # the first line is left empty
+            return
+        # the sidebar shows pages of sixty plies, the last page of the log
+        page = max(len(self.san) - 1, 0) // 60
+        ply = page * 60 + line * 2 - \
+            (x_position < BOARD_WIDTH + SIDEBAR_WIDTH * 3 // 5)
+        if ply <= len(self.game_log):
+            self.rewind(ply)
+
     def key_press(self, event):
         """Handle button presses."""
+        ply = len(self.game_log) if self.ply is None else self.ply
         if event.key == pygame.K_LEFT:  # left arrow key -> last position
-            if not self.game_log:
+            if not ply:
                 # looking for last position at the start position is inhibited
                 return
-            if not self.rewind_dict:
-                # set to the current position
-                self.rewind_dict['turn'] = self.turn
-                self.rewind_dict['board'] = self.board[:]
-                self.rewind_dict['piece_coordinate'] = \
-                    deepcopy(self.piece_coordinate)
-            self.rewind_dict['turn'] = self.\
-                update_position(self.rewind_dict, 'last')
-            self.draw_board(**self.rewind_dict)
+            self.rewind(ply - 1)
         elif event.key == pygame.K_RIGHT:  # right arrow key -> next position
-            if not self.temp_log or (self.promote and len(self.temp_log) == 1):
+            if self.ply is None:
                 # looking for next position at the latest position is inhibited
-                # stop looking for next position before making promotion choice
                 return
-            self.rewind_dict['turn'] = self.\
-                update_position(self.rewind_dict, 'next')
-            self.draw_board(**self.rewind_dict)
+            self.rewind(ply + 1)
         elif event.key == pygame.K_u:  # U key -> undo move
             self.undo_move()
+        elif event.key == pygame.K_s:  # S key -> save the game as PGN
+            self.save_game()
+        elif event.key == pygame.K_b:  # B key -> play a book move
+            self.play_book_move()
+        elif event.key == pygame.K_a:  # A key -> engine analysis on or off
+            self.toggle_analysis()
 
     def play(self):
         """Take user inputs, draw and update the chess board."""
@@ -440,28 +528,31 @@ class Game(Setup, Log):
         self.draw_board()
         self.draw_sidebar()
         while True:
-            self.clock.tick(FPS)
-            pygame.display.flip()
-            for event in pygame.event.get():
+            self.show_analysis()
+            self.render()
+            for event in self.wait_events():
                 if event.type == pygame.QUIT:
+                    self.close_analysis()
                     return False  # ongoing -> False
                 elif event.type == pygame.MOUSEBUTTONDOWN:
-                    if not self.rewind_dict:
+                    if event.button == 1 and \
+                            pygame.mouse.get_pos()[0] >= BOARD_WIDTH:
+                        self.sidebar_click()  # jump to a move of the log
+                    elif self.ply is None:
                         self.mouse_click(event)
                     else:  # if the board just got rewound:
-                        self.draw_board()
-                        if self.promote:
-                            self.draw_promotion_prompt()
-                        # reset the rewind dictionary and game log
-                        self.rewind_dict.clear()
-                        self.game_log += self.temp_log
-                        self.temp_log.clear()
+                        # return to the current position
+                        self.rewind(len(self.game_log))
                 elif event.type == pygame.KEYDOWN:
                     self.key_press(event)
             if Game.result:
+                self.close_analysis()
                 return True  # ongoing -> True
 
 
 if __name__ == '__main__':
     prep()
-    Game().play()
+    opening_book = open_book()
+    Game(opening_book).play()
+    if opening_book is not None:
+        opening_book.close()
@@ -0,0 +1,172 @@
+from array import array
+from collections.abc import Sequence
+
+from bitboard import squares_of
+from position import decode_move, PIECE_CODES, PIECE_SYMBOLS, Position, \
+    square_name
+
+
+# a log entry packs a move and what it did into 32 bits:
+# bits 0-14 -> the move as position.encode_move packs it,
+# bits 16-19 -> code of the moving piece, bits 20-23 -> code of the piece
+# taken or 0, bits 24-29 -> the flags below, only en passant and castling
+# get kept in a log, the rest are worked out for SAN by san_flags()
+EN_PASSANT, CASTLE, CHECK, CHECKMATE, FILE_NEEDED, RANK_NEEDED = \
+    (1 << bit for bit in range(24, 30))
+
+
+def log_entry(position, move):
+    """Pack a legal move of a position and the pieces it moves into an entry.
+
+    Only the board gets looked at, the flags needed by SAN alone are left
+    to san_flags(), so keeping a log costs next to nothing.
+    """
+    start, target, _ = decode_move(move)
+    board = position.board
+    piece, captured, flags = board[start], board[target], 0
+    if piece[1] == 'P' and start % 8 != target % 8 and captured == '00':
+        captured, flags = board[position.en_passant], EN_PASSANT
+    elif piece[1] == 'K' and abs(target - start) == 2:
+        flags = CASTLE
+    return move | PIECE_CODES[piece] << 16 | \
+        (PIECE_CODES[captured] if captured != '00' else 0) << 20 | flags
+
+
+def san_flags(position, entry):
+    """Return the check and disambiguation flags of an entry's move."""
+    start, target, _ = decode_move(entry & 0x7FFF)
+    piece, flags = position.board[start], 0
+    if piece[1] not in 'PK':
+        # other identical pieces attacking the target square, the ones
+        # pinned away from it cannot go there, and any check is already
+        # answered by going to the same target square as the move
+        others = position.attackers(target, piece[0]) & \
+            position.bitboards[piece] & ~(1 << start)
+        if others:
+            pins = position.pins(piece[0])
+            others = [square for square in squares_of(others)
+                      if square not in pins or pins[square] >> target & 1]
+        if others:
+            if all(square % 8 != start % 8 for square in others):
+                flags = FILE_NEEDED
+            elif all(square // 8 != start // 8 for square in others):
+                flags = RANK_NEEDED
+            else:
+                flags = FILE_NEEDED | RANK_NEEDED
+
+    undo = position.make_move(entry & 0x7FFF)
+    if position.is_attacked(position.turn):
+        flags |= CHECK if position.has_any_legal_move() else CHECKMATE
+    position.unmake_move(undo)
+    return flags
+
+
+def move_san(position, move):
+    """Return a legal move of a position in standard algebraic notation."""
+    entry = log_entry(position, move)
+    return entry_san(entry | san_flags(position, entry))
+
+
+def read_entry(entry):
+    """Unpack a log entry into start, target, promotion, piece, and taken."""
+    start, target, promotion = decode_move(entry & 0x7FFF)
+    captured = entry >> 20 & 15
+    return start, target, promotion, PIECE_SYMBOLS[entry >> 16 & 15], \
+        PIECE_SYMBOLS[captured] if captured else '00'
+
+
+def legacy_notation(entry):
+    """Return the notation of the old string logs, such as wP1506xbN=wR."""
+    start, target, promotion, piece, captured = read_entry(entry)
+    # <piece symbol><start square><target square>
+    notation = piece + str(start).zfill(2) + str(target).zfill(2)
+    if entry & EN_PASSANT:
+        notation += 'E' + captured  # en passant notation example: wP2819EbP
+    elif captured != '00':
+        notation += 'x' + captured
+    return notation + ('=' + piece[0] + promotion if promotion else '')
+
+
+def entry_san(entry):
+    """Return the standard algebraic notation of a log entry."""
+    start, target, promotion, piece, captured = read_entry(entry)
+    if entry & CASTLE:
+        san = 'O-O' if target > start else 'O-O-O'
+    else:
+        san = piece[1] if piece[1] != 'P' else ''
+        if piece[1] == 'P' and captured != '00':
+            # specify a pawn's file whenever it captures a piece
+            san += square_name(start)[0]
+        if entry & FILE_NEEDED:
+            san += square_name(start)[0]
+        if entry & RANK_NEEDED:
+            san += square_name(start)[1]
+        san += ('x' if captured != '00' else '') + square_name(target)
+        san += '=' + promotion if promotion else ''
+    return san + ('#' if entry & CHECKMATE else '+' if entry & CHECK else '')
+
+
+class SanView(Sequence):
+    """The class for reading a game log in standard algebraic notation.
+
+    Notation gets worked out only when read, by replaying the log on a
+    position of its own, and stays cached until its moves are taken back.
+    """
+
+    def __init__(self, game_log):
+        self.game_log = game_log
+        self.position = Position()
+        self.undoes = []  # information to unmake the replayed moves
+        self.cache = []
+
+    def forget(self, length):
+        """Drop the cached notation of the moves beyond a log length."""
+        while len(self.cache) > length:
+            self.position.unmake_move(self.undoes.pop())
+            self.cache.pop()
+
+    def _catch_up(self, length):
+        """Work out the notation of the first moves of the log."""
+        while len(self.cache) < length:
+            entry = self.game_log[len(self.cache)]
+            self.cache.append(
+                entry_san(entry | san_flags(self.position, entry)))
+            self.undoes.append(self.position.make_move(entry & 0x7FFF))
+
+    def __len__(self):
+        return len(self.game_log)
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            indices = range(*index.indices(len(self.game_log)))
+            if indices:
+                self._catch_up(max(indices) + 1)
+            return [self.cache[index] for index in indices]
+        if index < 0:
+            index += len(self.game_log)
+        if not 0 <= index < len(self.game_log):
+            raise IndexError('move index out of range')
+        self._catch_up(index + 1)
+        return self.cache[index]
+
+
+class Log:
+    """The class for game logs."""
+
+    def __init__(self):
+        self.game_log = array('I')  # log entries, see log_entry()
+        self.san = SanView(self.game_log)  # standard algebraic notation
+
+    def track_the_game(self, position, move):
+        """Keep track of a move about to be made in the position."""
+        self.game_log.append(log_entry(position, move))
+
+    def take_back(self):
+        """Remove the last move from the log and return its entry."""
+        entry = self.game_log.pop()
+        self.san.forget(len(self.game_log))
+        return entry
+
+    def legacy_log(self):
+        """Return the game log in the notation of the old string logs."""
+        return [legacy_notation(entry) for entry in self.game_log]
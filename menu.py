@@ -1,6 +1,6 @@
 import pygame
-from game import Game, FPS, WINDOW_WIDTH, \
-    WINDOW_HEIGHT, BLACK, BACKGROUND_COLOR
+from game import Game, open_book, WINDOW_WIDTH, WINDOW_HEIGHT, BLACK, \
+    BACKGROUND_COLOR
 from prep import prep
 
 
@@ -17,12 +17,13 @@ class Menu(Game):
     """The class for the game menu."""
 
     def __init__(self):
-        super().__init__()
+        super().__init__(open_book())  # opened once, shared by every game
         self.larger_font = pygame.font.Font(None, LARGER_FONT_SIZE)
         self.smaller_font = pygame.font.Font(None, SMALLER_FONT_SIZE)
 
         self.ongoing = True
         self.in_main_menu = True
+        self.finished_game = None  # kept for saving from the result page
 
     def draw_title_surface(self):
         """Draw title surface."""
@@ -64,6 +65,7 @@ class Menu(Game):
         """Customize a menu page for the result page."""
         self.draw_text('larger', Game.result[0].title(), 5)
         self.draw_text('smaller', Game.result[1].title(), 3)
+        self.draw_text('smaller', 'Press S to save the game as PGN', 2)
         # return button names and the corresponding actions
         return ('New Game', 'Main Menu'), (None, ('in_main_menu', True))
 
@@ -77,13 +79,16 @@ class Menu(Game):
             ((WINDOW_WIDTH - BUTTON_WIDTH) // 2, WINDOW_HEIGHT // 10 * 8))
         for index, button_coordinate in enumerate(button_coordinates):
             self.draw_button(button_names[index], button_coordinate)
+        pygame.display.flip()  # the page stays the same until left
         while True:
-            self.clock.tick(FPS)
-            pygame.display.flip()
-            for event in pygame.event.get():
+            for event in self.wait_events():
                 if event.type == pygame.QUIT:
                     self.ongoing = False
                     return
+                elif event.type == pygame.KEYDOWN and \
+                        event.key == pygame.K_s and \
+                        page_name == 'result_page':
+                    self.finished_game.save_game()
                 elif event.type == pygame.MOUSEBUTTONDOWN:
                     for index, action in enumerate(actions):
                         # check which button is clicked and take the
@@ -99,10 +104,13 @@ class Menu(Game):
             if self.in_main_menu:
                 self.menu_page('main_menu')
             else:
-                self.ongoing = Game().play()
+                self.finished_game = Game(self.book)
+                self.ongoing = self.finished_game.play()
                 if not self.ongoing:
-                    return
+                    break
                 self.menu_page('result_page')
+        if self.book is not None:
+            self.book.close()
 
 
 if __name__ == '__main__':
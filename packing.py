@@ -0,0 +1,182 @@
+from sys import exit
+
+from position import Position, START_FEN
+
+
+PACKED_SIZE = 32  # bytes per position
+SYMBOLS = [color + piece for color in 'wb' for piece in 'PNBRQK']
+CODES = {symbol: code for code, symbol in enumerate(SYMBOLS)}
+# codes beyond the twelve symbols carry the rest of the state with a piece
+EN_PASSANT_PAWN = 12  # a pawn that just moved two squares
+CASTLE_ROOK = 13  # a rook its king may still castle with
+BLACK_KING_TO_MOVE = 14  # the black king, when black is to move
+CASTLE_ROOKS = {63: ('w', 'short'), 56: ('w', 'long'),
+                7: ('b', 'short'), 0: ('b', 'long')}
+# positions whose state rides on the piece codes in every way it can
+ROUND_TRIP_FENS = [
+    START_FEN,
+    'r3k2r/p1ppqpb1/bn2pnp1/3PN3/1p2P3/2N2Q1p/PPPBBPPP/R3K2R w KQkq - 0 1',
+    'rnbqkbnr/ppp1p1pp/8/3pPp2/8/8/PPPP1PPP/RNBQKBNR w KQkq f6 0 3',
+    'rnbqkbnr/pppp1ppp/8/8/3Pp3/4P3/PPP2PPP/RNBQKBNR b KQkq d3 0 3',
+    # black rooks in white's corners while black may still castle
+    'r3k2r/8/8/8/8/8/8/4K2r b k - 0 1',
+    'r3k2r/8/8/8/8/8/8/r3K3 w q - 5 40',
+    'R3k2R/8/8/8/8/8/8/R3K2R b KQ - 0 1',
+]
+
+# bytes 0-7 -> occupied squares, a little-endian bitboard (bit n, square n)
+# bytes 8-23 -> a 4-bit code for each piece in square order, low nibble first
+# bytes 24-25 -> halfmove clock, bytes 26-27 -> fullmove number
+# bytes 28-31 -> zeros
+
+
+def pack_position(position):
+    """Pack a position into 32 bytes."""
+    occupied, codes = 0, []
+    for square, piece in enumerate(position.board):
+        if piece == '00':
+            continue
+        occupied |= 1 << square
+        code = CODES[piece]
+        if square == position.en_passant:
+            code = EN_PASSANT_PAWN
+        elif piece[1] == 'R' and square in CASTLE_ROOKS and \
+                piece[0] == CASTLE_ROOKS[square][0] and \
+                position.castle_flags[piece[0]][CASTLE_ROOKS[square][1]]:
+            # only a rook of the corner's own color carries its castle right
+            code = CASTLE_ROOK
+        elif piece == 'bK' and position.turn == 'b':
+            code = BLACK_KING_TO_MOVE
+        codes.append(code)
+    if len(codes) > 32:
+        raise ValueError('more than 32 pieces cannot be packed')
+    codes += [0] * (32 - len(codes))
+    nibbles = bytes(codes[index] | codes[index + 1] << 4
+                    for index in range(0, 32, 2))
+    return occupied.to_bytes(8, 'little') + nibbles + \
+        min(position.halfmove_clock, 0xFFFF).to_bytes(2, 'little') + \
+        min(position.fullmove_number, 0xFFFF).to_bytes(2, 'little') + \
+        bytes(4)
+
+
+def unpack_position(data):
+    """Unpack 32 bytes into a position."""
+    occupied = int.from_bytes(data[:8], 'little')
+    board, turn, en_passant = ['00'] * 64, 'w', None
+    castle_flags = {'w': {'short': False, 'long': False},
+                    'b': {'short': False, 'long': False}}
+    index = 0
+    while occupied:
+        lowest = occupied & -occupied
+        square = lowest.bit_length() - 1
+        occupied ^= lowest
+        code = data[8 + index // 2] >> 4 * (index & 1) & 15
+        index += 1
+        if code == EN_PASSANT_PAWN:
+            # a white pawn lands on the fourth rank, a black one on the fifth
+            code, en_passant = CODES['wP' if square // 8 == 4 else 'bP'], \
+                square
+        elif code == CASTLE_ROOK:
+            color, side = CASTLE_ROOKS[square]
+            code, castle_flags[color][side] = CODES[color + 'R'], True
+        elif code == BLACK_KING_TO_MOVE:
+            code, turn = CODES['bK'], 'b'
+        board[square] = SYMBOLS[code]
+    position = Position()
+    position.set_board(board, turn, castle_flags, en_passant,
+                       int.from_bytes(data[24:26], 'little'),
+                       int.from_bytes(data[26:28], 'little'))
+    return position
+
+
+def pack_positions(positions):
+    """Pack positions into one contiguous buffer of 32 bytes each."""
+    return b''.join(pack_position(position) for position in positions)
+
+
+def unpack_positions(buffer):
+    """Yield the positions of a buffer of packed positions.
+
+    @param buffer: bytes, a bytearray, a memoryview, or a NumPy array
+    """
+    data = memoryview(buffer).cast('B')
+    for offset in range(0, len(data), PACKED_SIZE):
+        yield unpack_position(data[offset:offset + PACKED_SIZE])
+
+
+def unpack_arrays(buffer):
+    """Unpack a buffer of packed positions into NumPy arrays at once.
+
+    Returns a dict of boards (positions, 64) holding the index of a symbol
+    of SYMBOLS or -1 for empty squares, turns (1 for white, -1 for black),
+    castle_flags (positions, 4) in KQkq order, en_passant squares or -1,
+    and halfmove_clocks and fullmove_numbers.
+    """
+    # imported here since only bulk loading needs NumPy
+    import numpy as np
+
+    data = np.frombuffer(buffer, dtype=np.uint8).reshape(-1, PACKED_SIZE)
+    count = len(data)
+    occupied = np.unpackbits(data[:, :8], axis=1, bitorder='little')
+    codes = np.empty((count, 32), dtype=np.int8)
+    codes[:, 0::2], codes[:, 1::2] = data[:, 8:24] & 15, data[:, 8:24] >> 4
+    # the nth occupied square of a position holds its nth code
+    ranks = np.maximum(np.cumsum(occupied, axis=1) - 1, 0)
+    boards = np.where(occupied.astype(bool),
+                      np.take_along_axis(codes, ranks, axis=1), -1)
+    boards = boards.astype(np.int8)
+
+    squares = np.arange(64)
+    pawns = boards == EN_PASSANT_PAWN
+    en_passant = np.where(pawns.any(axis=1), pawns.argmax(axis=1), -1)
+    boards[pawns] = np.where(squares // 8 == 4, CODES['wP'],
+                             CODES['bP'])[np.nonzero(pawns)[1]]
+    rooks = boards == CASTLE_ROOK
+    castle_flags = rooks[:, [63, 56, 7, 0]]
+    boards[rooks] = np.where(squares // 8 == 7, CODES['wR'],
+                             CODES['bR'])[np.nonzero(rooks)[1]]
+    kings = boards == BLACK_KING_TO_MOVE
+    turns = np.where(kings.any(axis=1), -1, 1)
+    boards[kings] = CODES['bK']
+
+    counters = data[:, 24:28].copy().view('<u2')
+    return {'boards': boards, 'turns': turns, 'castle_flags': castle_flags,
+            'en_passant': en_passant, 'halfmove_clocks': counters[:, 0],
+            'fullmove_numbers': counters[:, 1]}
+
+
+def check_round_trips():
+    """Pack and unpack the round-trip positions, return whether all match."""
+    positions = [Position(fen) for fen in ROUND_TRIP_FENS]
+    buffer = pack_positions(positions)
+    passed = True
+    for position, unpacked in zip(positions, unpack_positions(buffer)):
+        matched = unpacked.fen() == position.fen()
+        print(f'{position.fen():<72} {"ok" if matched else "FAIL"}')
+        passed = passed and matched
+
+    arrays = unpack_arrays(buffer)
+    for index, position in enumerate(positions):
+        boards = [SYMBOLS[code] if code >= 0 else '00'
+                  for code in arrays['boards'][index]]
+        castle_flags = [position.castle_flags[color][side] for color, side in
+                        (('w', 'short'), ('w', 'long'),
+                         ('b', 'short'), ('b', 'long'))]
+        en_passant = arrays['en_passant'][index]
+        matched = boards == position.board and \
+            arrays['turns'][index] == (1 if position.turn == 'w' else -1) and \
+            list(arrays['castle_flags'][index]) == castle_flags and \
+            (None if en_passant < 0 else en_passant) == position.en_passant
+        if not matched:
+            print(f'{position.fen():<72} FAIL (arrays)')
+        passed = passed and matched
+    return passed
+
+
+def main():
+    """Check that positions survive packing and unpacking."""
+    exit(0 if check_round_trips() else 1)
+
+
+if __name__ == '__main__':
+    main()
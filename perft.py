@@ -0,0 +1,97 @@
+from argparse import ArgumentParser
+from sys import exit
+from time import perf_counter
+
+from position import move_name, Position, START_FEN
+
+
+# reference positions and their known leaf-node counts from depth 1 onwards
+# (https://www.chessprogramming.org/Perft_Results)
+REFERENCE_POSITIONS = {
+    'initial': (START_FEN, [
+        20, 400, 8902, 197281, 4865609, 119060324]),
+    'kiwipete': (
+        'r3k2r/p1ppqpb1/bn2pnp1/3PN3/1p2P3/2N2Q1p/PPPBBPPP/R3K2R w KQkq - 0 1',
+        [48, 2039, 97862, 4085603, 193690690]),
+    'position 3': ('8/2p5/3p4/KP5r/1R3p1k/8/4P1P1/8 w - - 0 1', [
+        14, 191, 2812, 43238, 674624, 11030083]),
+    'position 4': (
+        'r3k2r/Pppp1ppp/1b3nbN/nP6/BBP1P3/q4N2/Pp1P2PP/R2Q1RK1 w kq - 0 1',
+        [6, 264, 9467, 422333, 15833292]),
+    'position 5': (
+        'rnbq1k1r/pp1Pbppp/2p5/8/2B5/8/PPP1NnPP/RNBQK2R w KQ - 1 8',
+        [44, 1486, 62379, 2103487, 89941194]),
+    'position 6': (
+        'r4rk1/1pp1qppp/p1np1n2/2b1p1B1/2B1P1b1/P1NP1N2/1PP1QPPP/R4RK1 '
+        'w - - 0 10', [46, 2079, 89890, 3894594, 164075551])
+}
+
+
+def perft(position, depth):
+    """Count the leaf nodes of the move tree to the given depth."""
+    moves = position.generate_legal_moves()
+    if depth <= 1:
+        # the moves at the last ply are counted without being made
+        return len(moves) if depth == 1 else 1
+    nodes = 0
+    for move in moves:
+        undo = position.make_move(move)
+        nodes += perft(position, depth - 1)
+        position.unmake_move(undo)
+    return nodes
+
+
+def divide(position, depth):
+    """Count the leaf nodes under each legal move of the position."""
+    counts = {}
+    for move in position.generate_legal_moves():
+        undo = position.make_move(move)
+        counts[move_name(move)] = perft(position, depth - 1)
+        position.unmake_move(undo)
+    return counts
+
+
+def run_suite(max_depth):
+    """Check the reference positions and return whether all counts match."""
+    passed = True
+    for name, (fen, counts) in REFERENCE_POSITIONS.items():
+        for depth, expected in enumerate(counts[:max_depth], 1):
+            time = perf_counter()
+            nodes = perft(Position(fen), depth)
+            time = perf_counter() - time
+            print(f'{name:<12} depth {depth}  {nodes:>11}  '
+                  f'{"ok" if nodes == expected else f"FAIL ({expected})":<8}'
+                  f'{nodes / time if time else 0:>12.0f} nodes/s')
+            passed = passed and nodes == expected
+    return passed
+
+
+def main():
+    """Run perft from the command line."""
+    parser = ArgumentParser(description='Count move-tree leaf nodes.')
+    parser.add_argument('depth', type=int)
+    parser.add_argument('--fen', default=START_FEN)
+    parser.add_argument('--divide', action='store_true',
+                        help='print the node count under each root move')
+    parser.add_argument('--suite', action='store_true',
+                        help='verify the reference positions up to depth')
+    args = parser.parse_args()
+
+    if args.suite:
+        exit(0 if run_suite(args.depth) else 1)
+    position = Position(args.fen)
+    time = perf_counter()
+    if args.divide:
+        counts = divide(position, args.depth)
+        for move, nodes in sorted(counts.items()):
+            print(f'{move}: {nodes}')
+        nodes = sum(counts.values())
+    else:
+        nodes = perft(position, args.depth)
+    time = perf_counter() - time
+    print(f'nodes {nodes}  time {time:.3f}s  '
+          f'{nodes / time if time else 0:.0f} nodes/s')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,175 @@
+import re
+from collections import namedtuple
+from datetime import date
+
+from gamelog import move_san
+from position import decode_move, Position, START_FEN
+
+
+RESULTS = {'white wins': '1-0', 'black wins': '0-1', 'draw': '1/2-1/2'}
+SEVEN_TAG_ROSTER = ('Event', 'Site', 'Date', 'Round', 'White', 'Black',
+                    'Result')
+LINE_LENGTH = 79  # PGN export lines stay below 80 characters
+
+TAG = re.compile(r'\[\s*(\w+)\s+"((?:[^"\\]|\\.)*)"\s*\]')
+# movetext tokens: comments, variations, annotations, results, move numbers,
+# and whatever is left, which should be moves
+TOKEN = re.compile(r'\{[^}]*\}?|;[^\n]*|[()]|\$\d+|1-0|0-1|1/2-1/2|\*|'
+                   r'\d+\.+|[^\s{}();$]+')
+SAN = re.compile(r'([NBRQK])?([a-h])?([1-8])?x?([a-h][1-8])(?:=?([QRBN]))?$')
+
+# a game read from PGN, replayed up to an illegal or unreadable move if the
+# error says so
+ImportedGame = namedtuple('ImportedGame', [
+    'tags', 'moves', 'result', 'position', 'error'])
+
+
+def parse_san(position, san):
+    """Return the legal move a SAN string stands for in a position."""
+    text = san.rstrip('+#!?')
+    moves = position.generate_legal_moves()
+    if text in ('O-O', 'O-O-O', '0-0', '0-0-0'):
+        king = position.piece_coordinate[position.turn + 'K'][0]
+        target = king + 2 if len(text) == 3 else king - 2
+        for move in moves:
+            if move & 63 == king and move >> 6 & 63 == target:
+                return move
+        raise ValueError('illegal move: ' + san)
+
+    match = SAN.match(text)
+    if not match:
+        raise ValueError('unreadable move: ' + san)
+    piece, file, rank, target, promotion = match.groups()
+    piece = position.turn + (piece or 'P')
+    target = (8 - int(target[1])) * 8 + ord(target[0]) - 97
+    found = []
+    for move in moves:
+        start = move & 63
+        if move >> 6 & 63 == target and position.board[start] == piece and \
+                decode_move(move)[2] == (promotion or '') and \
+                (not file or start % 8 == ord(file) - 97) and \
+                (not rank or start // 8 == 8 - int(rank)):
+            found.append(move)
+    if len(found) != 1:
+        raise ValueError(('ambiguous' if found else 'illegal') + ' move: ' +
+                         san)
+    return found[0]
+
+
+def write_game(moves, tags=None, result=None, fen=None):
+    """Return the PGN of a game.
+
+    @param moves: the integer moves of the game
+    @param tags: tag pairs adding to or replacing the seven tag roster
+    @param result: a result from Position.result(), judged if left out
+    @param fen: the starting position, if not the initial one
+    """
+    position = Position(fen)
+    headers = dict.fromkeys(SEVEN_TAG_ROSTER, '?')
+    headers['Date'] = '????.??.??'
+    if fen is not None and fen != START_FEN:
+        headers['SetUp'], headers['FEN'] = '1', fen
+
+    words = []
+    for index, move in enumerate(moves):
+        if position.turn == 'w' or not index:
+            words.append(str(position.fullmove_number) +
+                         ('.' if position.turn == 'w' else '...'))
+        words.append(move_san(position, move))
+        position.make_move(move)
+    if result is None:
+        result = position.result()
+    headers['Result'] = RESULTS[result[0]] if result else '*'
+    headers.update(tags or {})
+    words.append(headers['Result'])
+
+    lines = []
+    for name, value in headers.items():
+        value = str(value).replace('\\', '\\\\').replace('"', '\\"')
+        lines.append(f'[{name} "{value}"]')
+    lines.append('')
+    line = ''
+    for word in words:  # wrap the movetext
+        if line and len(line) + 1 + len(word) > LINE_LENGTH:
+            lines.append(line)
+            line = word
+        else:
+            line += (' ' if line else '') + word
+    lines.append(line)
+    return '\n'.join(lines) + '\n'
+
+
+def split_games(lines):
+    """Yield the text of every game in an iterable of PGN lines."""
+    game, in_movetext, in_comment = [], False, False
+    for line in lines:
+        if line.startswith('%'):  # escaped lines are for other programs
+            continue
+        stripped = line.strip()
+        # a tag after the movetext starts the next game
+        if stripped.startswith('[') and in_movetext and not in_comment:
+            yield ''.join(game)
+            game, in_movetext = [], False
+        if stripped and not stripped.startswith('[') or in_comment:
+            in_movetext = True
+        if '{' in line or '}' in line:  # comments may span several lines
+            in_comment = line.rfind('{') > line.rfind('}')
+        game.append(line)
+    if any(line.strip() for line in game):
+        yield ''.join(game)
+
+
+def parse_game(text):
+    """Split the text of a game into its tags, SAN moves, and result."""
+    tags = {name: value.replace('\\"', '"').replace('\\\\', '\\')
+            for name, value in TAG.findall(text)}
+    movetext = TAG.sub('', text)
+    sans, result, depth = [], tags.get('Result', '*'), 0
+    for token in TOKEN.findall(movetext):
+        if token == '(':  # variations are skipped
+            depth += 1
+        elif token == ')':
+            depth -= 1
+        elif depth or token[0] in '{;$' or token[0].isdigit() and \
+                token.rstrip('.').isdigit():
+            continue
+        elif token in ('1-0', '0-1', '1/2-1/2', '*'):
+            result = token
+        else:
+            sans.append(token)
+    return tags, sans, result
+
+
+def replay_game(text):
+    """Replay the text of a game through the rules into an ImportedGame."""
+    tags, sans, result = parse_game(text)
+    moves, error = [], None
+    try:
+        position = Position(tags.get('FEN'))
+    except ValueError as exception:
+        return ImportedGame(tags, moves, result, None, str(exception))
+    for ply, san in enumerate(sans, 1):
+        try:
+            move = parse_san(position, san)
+        except ValueError as exception:
+            error = f'ply {ply}: {exception}'
+            break
+        position.make_move(move)
+        moves.append(move)
+    return ImportedGame(tags, moves, result, position, error)
+
+
+def import_games(path):
+    """Yield every game of a PGN file, one at a time, as an ImportedGame.
+
+    The file is read line by line, so memory stays constant however large
+    the file is.
+    """
+    with open(path, encoding='utf-8', errors='replace') as file:
+        for text in split_games(file):
+            yield replay_game(text)
+
+
+def today():
+    """Return the date of today as PGN writes dates."""
+    return date.today().strftime('%Y.%m.%d')
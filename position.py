@@ -0,0 +1,615 @@
+from collections import Counter, namedtuple
+from itertools import product
+from random import Random
+from bitboard import BETWEEN, bishop_attacks, BISHOP_LINES, FILE_A, FILE_H, \
+    FULL, KING_ATTACKS, KNIGHT_ATTACKS, PAWN_ATTACKS, PROMOTION_RANKS, \
+    rook_attacks, ROOK_LINES, squares_of
+from evaluate import ENDGAME_SCORES, MIDGAME_SCORES, PHASE_WEIGHTS
+from prep import Setup
+
+
+START_FEN = 'rnbqkbnr/pppppppp/8/8/8/8/PPPPPPPP/RNBQKBNR w KQkq - 0 1'
+PROMOTIONS = ('', 'Q', 'R', 'B', 'N')
+ROOK_SQUARES = {0: ('b', 'long'), 7: ('b', 'short'),
+                56: ('w', 'long'), 63: ('w', 'short')}
+# small integer codes of the pieces, bit 3 telling black pieces apart
+PIECE_CODES = {color + piece: code | (8 if color == 'b' else 0)
+               for color in 'wb'
+               for code, piece in enumerate('PNBRQK', 1)}
+PIECE_SYMBOLS = {code: symbol for symbol, code in PIECE_CODES.items()}
+
+# everything make_move changes that cannot be told from the move itself
+UndoInfo = namedtuple('UndoInfo', [
+    'move', 'piece', 'captured', 'captured_square', 'en_passant',
+    'castle_rights', 'halfmove_clock', 'hash'])
+
+# random 64-bit Zobrist keys, seeded so that hashes stay the same across runs
+_random = Random(20211108)
+ZOBRIST_PIECES = {color + piece: [_random.getrandbits(64) for _ in range(64)]
+                  for color in 'wb' for piece in 'PRNBQK'}
+ZOBRIST_CASTLE = {rights: _random.getrandbits(64)
+                  for rights in product((True, False), repeat=4)}
+ZOBRIST_EN_PASSANT = [_random.getrandbits(64) for _ in range(8)]  # by file
+ZOBRIST_BLACK_TO_MOVE = _random.getrandbits(64)
+
+
+def encode_move(start, target, promotion=''):
+    """Pack a chess move into an integer."""
+    # bits 0-5 -> start square, bits 6-11 -> target square,
+    # bits 12-14 -> index of the piece a pawn gets promoted to
+    return start | target << 6 | PROMOTIONS.index(promotion) << 12
+
+
+def decode_move(move):
+    """Unpack an integer chess move into start, target, and promotion."""
+    return move & 63, move >> 6 & 63, PROMOTIONS[move >> 12 & 7]
+
+
+def square_name(square):
+    """Convert numeric square notation to algebraic square notation."""
+    return chr(97 + square % 8) + str(8 - square // 8)
+
+
+def move_name(move):
+    """Return a move in coordinate notation, such as e2e4 or e7e8q."""
+    start, target, promotion = decode_move(move)
+    return square_name(start) + square_name(target) + promotion.lower()
+
+
+class Position(Setup):
+    """The class for headless chess positions (no pygame involved)."""
+
+    def __init__(self, fen=None):
+        super().__init__()
+        self.halfmove_clock = 0  # plies since the last capture or pawn move
+        self.fullmove_number = 1
+        self.piece_type_order = {  # symbols of a color, the king goes last
+            color: [color + piece for piece in 'PNBRQK'] for color in 'wb'}
+        if fen is not None:
+            self.set_fen(fen)
+        else:
+            self._set_up()
+
+    def _set_up(self):
+        """Derive bitboards, hash, and repetitions from the board."""
+        # bitboards of every piece symbol and of every color
+        self.bitboards = {symbol: 0 for symbol in self.piece_coordinate}
+        self.occupied = {'w': 0, 'b': 0}
+        # material and piece-square scores for evaluation, and the game phase
+        self.midgame_score = self.endgame_score = self.phase = 0
+        for symbol, squares in self.piece_coordinate.items():
+            for square in squares:
+                self.bitboards[symbol] |= 1 << square
+                self.occupied[symbol[0]] |= 1 << square
+                self.midgame_score += MIDGAME_SCORES[symbol][square]
+                self.endgame_score += ENDGAME_SCORES[symbol][square]
+                self.phase += PHASE_WEIGHTS[symbol[1]]
+
+        self.hash = self.compute_hash()
+        self.repetitions = Counter([self.hash])  # times positions occurred
+        # squares attacked by each color, worked out when first asked for
+        self.attack_maps = {'w': None, 'b': None}
+
+    def set_fen(self, fen):
+        """Set the position up from Forsyth-Edwards Notation."""
+        fields = fen.split()
+        if len(fields) == 4:  # the move counters are often left out
+            fields += ['0', '1']
+        if len(fields) != 6 or len(fields[0].split('/')) != 8:
+            raise ValueError('invalid FEN: ' + fen)
+        placement, turn, castle, en_passant, halfmove, fullmove = fields
+
+        board = []
+        for row, rank in enumerate(placement.split('/')):
+            for char in rank:
+                if char in '12345678':
+                    board.extend(['00'] * int(char))
+                elif char in 'PRNBQKprnbqk':
+                    board.append(('w' if char.isupper() else 'b') +
+                                 char.upper())
+                else:
+                    raise ValueError('invalid FEN: ' + fen)
+            if len(board) != row * 8 + 8:  # every rank has eight squares
+                raise ValueError('invalid FEN: ' + fen)
+        # castle rights come in KQkq order, each at most once
+        if castle != '-' and (not castle or ''.join(
+                char for char in 'KQkq' if char in castle) != castle):
+            raise ValueError('invalid FEN: ' + fen)
+        # FEN names the square passed over, while en_passant keeps the square
+        # of the pawn that moved forward two squares
+        try:
+            square = None
+            if en_passant != '-':
+                if len(en_passant) != 2 or en_passant[0] not in 'abcdefgh' \
+                        or en_passant[1] != ('6' if turn == 'w' else '3'):
+                    raise ValueError
+                square = (8 - int(en_passant[1])) * 8 + \
+                    ord(en_passant[0]) - 97 + (8 if turn == 'w' else -8)
+            self.set_board(board, turn, {
+                'w': {'short': 'K' in castle, 'long': 'Q' in castle},
+                'b': {'short': 'k' in castle, 'long': 'q' in castle}},
+                square, int(halfmove), int(fullmove))
+        except ValueError:
+            raise ValueError('invalid FEN: ' + fen) from None
+
+    def set_board(self, board, turn, castle_flags, en_passant=None,
+                  halfmove_clock=0, fullmove_number=1):
+        """Set the position up from a board list and the state of the game.
+
+        @param castle_flags: castle rights in the form of Setup.castle_flags,
+                             dropped where the king or rook has left home
+        @param en_passant: the square of a pawn that just moved two squares,
+                           dropped unless such a pawn can stand there
+        """
+        if len(board) != 64 or turn not in ('w', 'b') or \
+                halfmove_clock < 0 or fullmove_number < 0:
+            raise ValueError('invalid position')
+        # pawns never stand on the first or the last rank
+        if any(piece[1] == 'P' for piece in board[:8] + board[56:]):
+            raise ValueError('invalid position')
+        self.board = list(board)
+        self.piece_coordinate = {symbol: [] for symbol in
+                                 self.piece_coordinate}
+        for square, piece in enumerate(board):
+            if piece != '00':
+                self.piece_coordinate[piece].append(square)
+        if len(self.piece_coordinate['wK']) != 1 or \
+                len(self.piece_coordinate['bK']) != 1:
+            raise ValueError('invalid position')
+
+        self.turn = turn
+        # a castle right needs its king and rook on their original squares
+        self.castle_flags = {
+            'w': {'short': castle_flags['w']['short'] and
+                  board[60] == 'wK' and board[63] == 'wR',
+                  'long': castle_flags['w']['long'] and
+                  board[60] == 'wK' and board[56] == 'wR'},
+            'b': {'short': castle_flags['b']['short'] and
+                  board[4] == 'bK' and board[7] == 'bR',
+                  'long': castle_flags['b']['long'] and
+                  board[4] == 'bK' and board[0] == 'bR'}}
+        # an en passant square needs the pawn that just moved two squares,
+        # with the squares it passed over and left empty
+        step = -8 if turn == 'w' else 8
+        if en_passant is not None and not (
+                en_passant // 8 == (3 if turn == 'w' else 4) and
+                board[en_passant] == ('b' if turn == 'w' else 'w') + 'P' and
+                board[en_passant + step] == '00' and
+                board[en_passant + 2 * step] == '00'):
+            en_passant = None
+        self.en_passant = en_passant
+        self.halfmove_clock = halfmove_clock
+        self.fullmove_number = fullmove_number
+        self._set_up()
+
+    def fen(self):
+        """Return the position in Forsyth-Edwards Notation."""
+        ranks = []
+        for row in range(8):
+            rank, empty = '', 0
+            for piece in self.board[row * 8:row * 8 + 8]:
+                if piece == '00':
+                    empty += 1
+                    continue
+                rank += (str(empty) if empty else '') + \
+                    (piece[1] if piece[0] == 'w' else piece[1].lower())
+                empty = 0
+            ranks.append(rank + (str(empty) if empty else ''))
+        castle = ''.join(char for char, color, side in (
+            ('K', 'w', 'short'), ('Q', 'w', 'long'),
+            ('k', 'b', 'short'), ('q', 'b', 'long'))
+            if self.castle_flags[color][side]) or '-'
+        # like the hash, only name the square when a pawn can legally take
+        en_passant = '-'
+        if self._en_passant_hash():
+            en_passant = square_name(
+                self.en_passant + (-8 if self.turn == 'w' else 8))
+        return ' '.join(['/'.join(ranks), self.turn, castle, en_passant,
+                         str(self.halfmove_clock), str(self.fullmove_number)])
+
+    def compute_hash(self):
+        """Compute the Zobrist hash of the position from scratch."""
+        hash_ = ZOBRIST_CASTLE[self._castle_rights()] ^ \
+            self._en_passant_hash()
+        if self.turn == 'b':
+            hash_ ^= ZOBRIST_BLACK_TO_MOVE
+        for symbol, squares in self.piece_coordinate.items():
+            for square in squares:
+                hash_ ^= ZOBRIST_PIECES[symbol][square]
+        return hash_
+
+    def _en_passant_hash(self):
+        """Return the hash of the en passant right, if it can be used."""
+        # by FIDE rules, the right only tells positions apart when a pawn of
+        # the side to move can legally take en passant, not when it is
+        # pinned or taking would uncover a check along the rank
+        if self.en_passant is None:
+            return 0
+        target = self.en_passant + (-8 if self.turn == 'w' else 8)
+        for start in squares_of(
+                PAWN_ATTACKS['b' if self.turn == 'w' else 'w'][target] &
+                self.bitboards[self.turn + 'P']):
+            if self._is_safe(start, target, self.en_passant):
+                return ZOBRIST_EN_PASSANT[target % 8]
+        return 0
+
+    def attackers(self, square, color, occupied=None, ignored=0):
+        """Return a bitboard of the pieces of a color attacking a square."""
+        # look from the square with every piece type and meet the same type
+        if occupied is None:
+            occupied = self.occupied['w'] | self.occupied['b']
+        enemy = 'b' if color == 'w' else 'w'
+        bitboards = self.bitboards
+        return (PAWN_ATTACKS[enemy][square] & bitboards[color + 'P'] |
+                KNIGHT_ATTACKS[square] & bitboards[color + 'N'] |
+                KING_ATTACKS[square] & bitboards[color + 'K'] |
+                rook_attacks(square, occupied) &
+                (bitboards[color + 'R'] | bitboards[color + 'Q']) |
+                bishop_attacks(square, occupied) &
+                (bitboards[color + 'B'] | bitboards[color + 'Q'])) & ~ignored
+
+    def attack_map(self, color):
+        """Return a bitboard of the squares the pieces of a color attack.
+
+        Sliders see through the enemy king, so the map also marks the
+        squares that king would still be attacked on after stepping back.
+        A map is kept until the next move is made or unmade.
+        """
+        attacks = self.attack_maps[color]
+        if attacks is not None:
+            return attacks
+        enemy = 'b' if color == 'w' else 'w'
+        bitboards = self.bitboards
+        occupied = (self.occupied['w'] | self.occupied['b']) ^ \
+            bitboards[enemy + 'K']
+        pawns = bitboards[color + 'P']
+        # every pawn at once, white pawns attack towards square 0
+        if color == 'w':
+            attacks = (pawns & ~FILE_A) >> 9 | (pawns & ~FILE_H) >> 7
+        else:
+            attacks = ((pawns & ~FILE_A) << 7 | (pawns & ~FILE_H) << 9) \
+                & FULL
+        attacks |= KING_ATTACKS[self.piece_coordinate[color + 'K'][0]]
+        for square in squares_of(bitboards[color + 'N']):
+            attacks |= KNIGHT_ATTACKS[square]
+        for square in squares_of(bitboards[color + 'B'] |
+                                 bitboards[color + 'Q']):
+            attacks |= bishop_attacks(square, occupied)
+        for square in squares_of(bitboards[color + 'R'] |
+                                 bitboards[color + 'Q']):
+            attacks |= rook_attacks(square, occupied)
+        self.attack_maps[color] = attacks
+        return attacks
+
+    def is_attacked(self, color, verifying_square=None):
+        """Determine whether a square gets attacked."""
+        king = self.piece_coordinate[color + 'K'][0]
+        if verifying_square is None:  # the default verifying piece is the king
+            verifying_square = king
+        if verifying_square != king:
+            # the attack maps see through the king, not through other squares
+            return bool(self.attackers(
+                verifying_square, 'b' if color == 'w' else 'w'))
+        return bool(self.attack_map('b' if color == 'w' else 'w') >>
+                    verifying_square & 1)
+
+    def _is_safe(self, start, target, captured_square):
+        """Check whether a move leaves the mover's king unattacked."""
+        color = self.board[start][0]
+        enemy = 'b' if color == 'w' else 'w'
+        occupied = (self.occupied['w'] | self.occupied['b']) & \
+            ~(1 << start | 1 << captured_square) | 1 << target
+        king_square = target if self.board[start][1] == 'K' else \
+            self.piece_coordinate[color + 'K'][0]
+        return not self.attackers(
+            king_square, enemy, occupied, 1 << captured_square)
+
+    def _pseudo_legal(self, start):
+        """Return a bitboard of a piece's moves ignoring its king's safety."""
+        color, piece = self.board[start]
+        own = self.occupied[color]
+        occupied = own | self.occupied['b' if color == 'w' else 'w']
+        if piece == 'P':
+            direction = -8 if color == 'w' else 8
+            targets = PAWN_ATTACKS[color][start] & (occupied ^ own)
+            if self.en_passant is not None:
+                targets |= PAWN_ATTACKS[color][start] & \
+                    1 << self.en_passant + direction
+            if not occupied >> start + direction & 1:
+                targets |= 1 << start + direction
+                # pawns can move forward two squares on their first move
+                if start // 8 == (6 if color == 'w' else 1) and \
+                        not occupied >> start + 2 * direction & 1:
+                    targets |= 1 << start + 2 * direction
+            return targets
+        if piece == 'N':
+            targets = KNIGHT_ATTACKS[start]
+        elif piece == 'B':
+            targets = bishop_attacks(start, occupied)
+        elif piece == 'R':
+            targets = rook_attacks(start, occupied)
+        elif piece == 'Q':
+            targets = rook_attacks(start, occupied) | \
+                bishop_attacks(start, occupied)
+        else:
+            targets = KING_ATTACKS[start] | self._castle(start, occupied)
+        return targets & ~own
+
+    def _castle(self, start, occupied):
+        """Return a bitboard of king's targets for castling."""
+        color = self.board[start][0]
+        flags, rook = self.castle_flags[color], self.bitboards[color + 'R']
+        # squares between king and rook involved are unoccupied
+        short = flags['short'] and rook >> start + 3 & 1 and \
+            not occupied & (1 << start + 1 | 1 << start + 2)
+        long = flags['long'] and rook >> start - 4 & 1 and \
+            not occupied & (1 << start - 1 | 1 << start - 2 | 1 << start - 3)
+        if not short and not long:
+            return 0
+        # and king cannot castle out of check, nor cross over or end on
+        # squares that are attacked, seeing through the king makes no
+        # difference: whatever attacks a square through it attacks it too
+        attacked = self.attack_map('b' if color == 'w' else 'w')
+        if attacked >> start & 1:
+            return 0
+        targets = 0
+        if short and not attacked & (1 << start + 1 | 1 << start + 2):
+            targets |= 1 << start + 2
+        if long and not attacked & (1 << start - 1 | 1 << start - 2):
+            targets |= 1 << start - 2
+        return targets
+
+    def _masks(self, color):
+        """Return the king square, checkers, and pins of a color."""
+        enemy = 'b' if color == 'w' else 'w'
+        king = self.piece_coordinate[color + 'K'][0]
+        occupied = self.occupied['w'] | self.occupied['b']
+        checkers = self.attackers(king, enemy, occupied)
+
+        # a piece is pinned when it is the only piece between its king and
+        # an enemy slider, it may then only move along that line
+        pins = {}
+        bitboards = self.bitboards
+        snipers = ROOK_LINES[king] & \
+            (bitboards[enemy + 'R'] | bitboards[enemy + 'Q']) | \
+            BISHOP_LINES[king] & \
+            (bitboards[enemy + 'B'] | bitboards[enemy + 'Q'])
+        for sniper in squares_of(snipers):
+            between = BETWEEN[king][sniper] & occupied
+            if between and not between & between - 1 and \
+                    between & self.occupied[color]:
+                pins[between.bit_length() - 1] = \
+                    BETWEEN[king][sniper] | 1 << sniper
+        return king, checkers, pins
+
+    def pins(self, color):
+        """Return the lines pinned pieces of a color may move along."""
+        return self._masks(color)[2]
+
+    def _legal_targets(self, start, king, checkers, pins):
+        """Return a bitboard of legal targets using check and pin masks."""
+        targets = self._pseudo_legal(start)
+        if start == king:
+            enemy = 'b' if self.board[start][0] == 'w' else 'w'
+            attacked = self.attack_maps[enemy]
+            if attacked is not None:
+                # the attack map sees through the king, so the king does not
+                # block the attacks it steps away from
+                return targets & ~attacked
+            # with no map yet, a few lookups beat working out a whole map
+            occupied = (self.occupied['w'] | self.occupied['b']) ^ 1 << king
+            for target in squares_of(targets):
+                if self.attackers(target, enemy, occupied):
+                    targets ^= 1 << target
+            return targets
+        if checkers & checkers - 1:  # only the king can escape double checks
+            return 0
+
+        en_passant_target = 0
+        if self.board[start][1] == 'P' and self.en_passant is not None:
+            en_passant_target = targets & 1 << self.en_passant + \
+                (-8 if self.board[start][0] == 'w' else 8) & \
+                PAWN_ATTACKS[self.board[start][0]][start]
+            if en_passant_target:
+                # en passant removes two pieces from a rank, so it is
+                # verified directly instead of through the masks
+                targets ^= en_passant_target
+                if not self._is_safe(start, en_passant_target.bit_length() -
+                                     1, self.en_passant):
+                    en_passant_target = 0
+        if checkers:  # capture the checker or block the check
+            targets &= checkers | BETWEEN[king][checkers.bit_length() - 1]
+        if start in pins:
+            targets &= pins[start]
+        return targets | en_passant_target
+
+    def legal(self, start):
+        """Return legal squares for the specific piece."""
+        return list(squares_of(self._legal_targets(
+            start, *self._masks(self.board[start][0]))))
+
+    def generate_legal_moves(self, captures_only=False):
+        """Return all legal moves of the side to move.
+
+        @param captures_only: only return captures and pawn promotions
+        """
+        moves = []
+        king, checkers, pins = self._masks(self.turn)
+        wanted = FULL
+        if captures_only:
+            wanted = self.occupied['b' if self.turn == 'w' else 'w']
+        for symbol in self.piece_type_order[self.turn]:
+            pieces, wanted_targets = self.bitboards[symbol], wanted
+            if symbol[1] == 'P' and captures_only:
+                wanted_targets |= PROMOTION_RANKS
+                if self.en_passant is not None:
+                    wanted_targets |= 1 << self.en_passant + \
+                        (-8 if self.turn == 'w' else 8)
+            while pieces:
+                lowest = pieces & -pieces
+                start = lowest.bit_length() - 1
+                pieces ^= lowest
+                targets = self._legal_targets(start, king, checkers, pins) \
+                    & wanted_targets
+                while targets:
+                    lowest = targets & -targets
+                    target = lowest.bit_length() - 1
+                    targets ^= lowest
+                    if symbol[1] == 'P' and lowest & PROMOTION_RANKS:
+                        # a pawn reaching the last rank must get promoted
+                        moves.extend(start | target << 6 | promotion << 12
+                                     for promotion in range(1, 5))
+                    else:
+                        moves.append(start | target << 6)
+        return moves
+
+    legal_moves = generate_legal_moves  # the name used before masks came
+
+    def has_any_legal_move(self):
+        """Determine whether the side to move has a legal move."""
+        masks = self._masks(self.turn)
+        # the king goes first, it is the only piece able to move when double
+        # checked, and the likeliest one to move when checkmated
+        for symbol in self.piece_type_order[self.turn][::-1]:
+            for start in squares_of(self.bitboards[symbol]):
+                if self._legal_targets(start, *masks):
+                    return True
+        return False
+
+    def _put(self, piece, square):
+        """Put a piece on an empty square."""
+        self.piece_coordinate[piece].append(square)
+        self.board[square] = piece
+        self.bitboards[piece] |= 1 << square
+        self.occupied[piece[0]] |= 1 << square
+        self.hash ^= ZOBRIST_PIECES[piece][square]
+        self.midgame_score += MIDGAME_SCORES[piece][square]
+        self.endgame_score += ENDGAME_SCORES[piece][square]
+        self.phase += PHASE_WEIGHTS[piece[1]]
+
+    def _remove(self, piece, square):
+        """Remove a piece from its square."""
+        self.piece_coordinate[piece].remove(square)
+        self.board[square] = '00'
+        self.bitboards[piece] ^= 1 << square
+        self.occupied[piece[0]] ^= 1 << square
+        self.hash ^= ZOBRIST_PIECES[piece][square]
+        self.midgame_score -= MIDGAME_SCORES[piece][square]
+        self.endgame_score -= ENDGAME_SCORES[piece][square]
+        self.phase -= PHASE_WEIGHTS[piece[1]]
+
+    def _move_piece(self, piece, start, target):
+        """Move a piece to an empty square."""
+        self._remove(piece, start)
+        self._put(piece, target)
+
+    def _castle_rights(self):
+        """Return the castle flags as a tuple."""
+        flags = self.castle_flags
+        return (flags['w']['short'], flags['w']['long'],
+                flags['b']['short'], flags['b']['long'])
+
+    def make_move(self, move):
+        """Make a chess move and return the information to unmake it."""
+        start, target, promotion = decode_move(move)
+        piece, captured, captured_square = \
+            self.board[start], self.board[target], target
+        if piece[1] == 'P' and start % 8 != target % 8 and captured == '00':
+            # taking en passant
+            captured_square = self.en_passant
+            captured = self.board[captured_square]
+        undo = UndoInfo(move, piece, captured, captured_square,
+                        self.en_passant, self._castle_rights(),
+                        self.halfmove_clock, self.hash)
+        self.hash ^= self._en_passant_hash()
+
+        if captured != '00':
+            self._remove(captured, captured_square)
+        self._remove(piece, start)
+        self._put(piece[0] + promotion if promotion else piece, target)
+        if piece[1] == 'K':
+            if target == start + 2:  # reposition the rook after short castle
+                self._move_piece(piece[0] + 'R', start + 3, start + 1)
+            elif target == start - 2:  # reposition the rook after long castle
+                self._move_piece(piece[0] + 'R', start - 4, start - 1)
+            # can't castle if the king has previously moved
+            self.castle_flags[piece[0]]['short'] = False
+            self.castle_flags[piece[0]]['long'] = False
+        # can't castle with a rook that has moved or got captured
+        for square in (start, target):
+            if square in ROOK_SQUARES:
+                color, side = ROOK_SQUARES[square]
+                self.castle_flags[color][side] = False
+
+        # en passant capture must be made on the very next turn
+        self.en_passant = \
+            target if piece[1] == 'P' and abs(start - target) == 16 else None
+        self.halfmove_clock = \
+            0 if piece[1] == 'P' or captured != '00' else \
+            self.halfmove_clock + 1
+        self.turn = 'b' if self.turn == 'w' else 'w'
+        if self.turn == 'w':
+            self.fullmove_number += 1
+        self.hash ^= ZOBRIST_CASTLE[undo.castle_rights] ^ \
+            ZOBRIST_CASTLE[self._castle_rights()] ^ \
+            ZOBRIST_BLACK_TO_MOVE ^ self._en_passant_hash()
+        self.repetitions[self.hash] += 1
+        self.attack_maps['w'] = self.attack_maps['b'] = None
+        return undo
+
+    def unmake_move(self, undo):
+        """Take back the last chess move with the information to unmake it."""
+        start, target, promotion = decode_move(undo.move)
+        piece, captured = undo.piece, undo.captured
+        flags = self.castle_flags
+        flags['w']['short'], flags['w']['long'], \
+            flags['b']['short'], flags['b']['long'] = undo.castle_rights
+        self.en_passant, self.halfmove_clock = \
+            undo.en_passant, undo.halfmove_clock
+        if self.repetitions[self.hash] == 1:  # keep the counter small
+            del self.repetitions[self.hash]
+        else:
+            self.repetitions[self.hash] -= 1
+        self.turn = piece[0]
+        if self.turn == 'b':
+            self.fullmove_number -= 1
+
+        self._remove(piece[0] + promotion if promotion else piece, target)
+        self._put(piece, start)
+        if piece[1] == 'K':
+            if target == start + 2:  # put the rook back after short castle
+                self._move_piece(piece[0] + 'R', start + 1, start + 3)
+            elif target == start - 2:  # put the rook back after long castle
+                self._move_piece(piece[0] + 'R', start - 1, start - 4)
+        if captured != '00':
+            self._put(captured, undo.captured_square)
+        self.hash = undo.hash
+        self.attack_maps['w'] = self.attack_maps['b'] = None
+
+    def result(self):
+        """Return the result of the position, or None if the game goes on."""
+        # check whether there are any legal moves
+        if not self.has_any_legal_move():
+            # determine whether the king gets checkmated or stalemated
+            if self.is_attacked(self.turn):
+                victor = 'black' if self.turn == 'w' else 'white'
+                return [victor + ' wins', 'by checkmate']
+            return ['draw', 'by stalemate']
+
+        # check the possibility of checkmate
+        if len(self.piece_coordinate['wB']) + \
+                len(self.piece_coordinate['wN']) <= 1 and \
+                len(self.piece_coordinate['bB']) + \
+                len(self.piece_coordinate['bN']) <= 1:
+            for symbol, squares in self.piece_coordinate.items():
+                if symbol[1] not in 'BNK' and squares:
+                    break
+            else:
+                return ['draw', 'insufficient material']
+
+        # check fifty-move rule and threefold repetition
+        if self.halfmove_clock >= 100:
+            return ['draw', 'fifty-move rule']
+        if self.repetitions[self.hash] >= 3:
+            return ['draw', 'repetition']
+        return None
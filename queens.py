@@ -5,7 +5,7 @@ from typing import List, Tuple
 import pygame
 
 from game import BOARD_WIDTH, WINDOW_HEIGHT, \
-    DARK_SQUARE, FPS, Game, LIGHT_SQUARE
+    DARK_SQUARE, Game, LIGHT_SQUARE
 from prep import prep
 
 
@@ -74,10 +74,9 @@ class EightQueens(Game):
     def play(self):
         """New play method for the eight queens puzzle."""
         self.draw_empty_board()
+        pygame.display.flip()
         while True:
-            self.clock.tick(FPS)
-            pygame.display.flip()
-            for event in pygame.event.get():
+            for event in self.wait_events():
                 if event.type == pygame.QUIT:
                     return
                 elif event.type == pygame.KEYDOWN:
@@ -90,6 +89,7 @@ class EightQueens(Game):
                         self.color = choice(['wQ', 'bQ'])
                         self.count = 0
                         self.eight_queens()
+                        pygame.display.flip()
 
 
 if __name__ == '__main__':
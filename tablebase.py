@@ -0,0 +1,418 @@
+from argparse import ArgumentParser
+from array import array
+from collections import defaultdict
+from mmap import ACCESS_READ, mmap
+from multiprocessing import cpu_count, Pool
+from os import makedirs, path
+from sys import stderr
+from time import perf_counter
+
+from bitboard import bishop_attacks, KING_ATTACKS, KNIGHT_ATTACKS, \
+    PAWN_ATTACKS, rook_attacks, squares_of
+
+
+# every table holds a byte per position, indexed by the squares of the
+# white king (files a-d only, the rest is mirrored), the black king, and
+# the other pieces, then by the side to move; a byte is 0 for a draw, 255
+# for an illegal position, and otherwise one more than the plies to mate,
+# an odd number of plies for the side to move winning and even for losing
+DRAW, ILLEGAL = 0, 255
+TABLES = ('KQK', 'KRK', 'KPK', 'KBNK')  # a table only needs those before
+MAX_PIECES = 4  # the most pieces of any table, the kings included
+PIECE_ORDER = 'QRBNP'  # the order of pieces in table names
+DIRECTORY = 'tablebases'
+CHUNK = 4096  # positions sent to a worker at once
+
+
+def table_name(pieces):
+    """Return the name of the table of a king and the pieces of one side."""
+    return 'K' + ''.join(sorted(pieces, key=PIECE_ORDER.index)) + 'K'
+
+
+def _kinds(name):
+    """Return the piece of every square of an index of a table."""
+    return ('K', 'K') + tuple(name[1:-1])
+
+
+def _index(squares, black_to_move):
+    """Return the index of squares, with the white king on files a-d."""
+    if squares[0] % 8 > 3:
+        squares = [square ^ 7 for square in squares]  # mirror the files
+    index = squares[0] // 8 * 4 + squares[0] % 8
+    for square in squares[1:]:
+        index = index * 64 + square
+    return index * 2 + black_to_move
+
+
+def _squares(index, count):
+    """Return the squares and the side to move of an index."""
+    black_to_move, index = index & 1, index >> 1
+    squares = []
+    for _ in range(count - 1):
+        squares.append(index & 63)
+        index >>= 6
+    squares.append(index // 4 * 8 + index % 4)
+    return squares[::-1], black_to_move
+
+
+def _attacks(kind, square, occupied):
+    """Return the squares a white piece attacks."""
+    if kind == 'N':
+        return KNIGHT_ATTACKS[square]
+    if kind == 'K':
+        return KING_ATTACKS[square]
+    if kind == 'P':
+        return PAWN_ATTACKS['w'][square]
+    attacks = 0
+    if kind in 'QR':
+        attacks |= rook_attacks(square, occupied)
+    if kind in 'QB':
+        attacks |= bishop_attacks(square, occupied)
+    return attacks
+
+
+def _white_attacks(kinds, squares, occupied):
+    """Return the squares the white pieces attack."""
+    attacks = KING_ATTACKS[squares[0]]
+    for kind, square in zip(kinds[2:], squares[2:]):
+        attacks |= _attacks(kind, square, occupied)
+    return attacks
+
+
+def _legal(kinds, squares, black_to_move):
+    """Check whether squares make a legal position."""
+    occupied = 0
+    for square in squares:
+        occupied |= 1 << square
+    if bin(occupied).count('1') != len(squares) or \
+            KING_ATTACKS[squares[0]] >> squares[1] & 1:
+        return False  # pieces share a square, or the kings touch
+    for kind, square in zip(kinds, squares):
+        if kind == 'P' and square // 8 in (0, 7):
+            return False
+    # the side that just moved cannot have left its king in check
+    return black_to_move or not _white_attacks(
+        kinds, squares, occupied ^ 1 << squares[1]) >> squares[1] & 1
+
+
+class _Generator:
+    """The class for the moves of the positions of a table."""
+
+    def __init__(self, name, directory):
+        self.name, self.kinds = name, _kinds(name)
+        self.subtables = Tablebases(directory)
+
+    def _outside(self, kinds, squares, black_to_move):
+        """Return the value of a position of another table."""
+        pieces = kinds[2:]
+        if not pieces or len(pieces) == 1 and pieces[0] in 'BN':
+            return DRAW  # no mate is possible
+        order = sorted(range(2, len(kinds)),
+                       key=lambda index: PIECE_ORDER.index(kinds[index]))
+        value = self.subtables.value(
+            table_name(pieces), squares[:2] + [squares[index]
+                                               for index in order],
+            black_to_move)
+        return DRAW if value == ILLEGAL else value
+
+    def moves(self, squares, black_to_move):
+        """Return the table indexes and outside values the moves reach."""
+        kinds, inside, outside = self.kinds, [], []
+        occupied = 0
+        for square in squares:
+            occupied |= 1 << square
+        if black_to_move:  # only the black king moves
+            black_king = squares[1]
+            attacked = _white_attacks(kinds, squares,
+                                      occupied ^ 1 << black_king)
+            for target in squares_of(KING_ATTACKS[black_king] & ~attacked):
+                moved = squares[:]
+                moved[1] = target
+                if occupied >> target & 1:  # take a white piece
+                    taken = moved.index(target, 2)
+                    outside.append(self._outside(
+                        kinds[:taken] + kinds[taken + 1:],
+                        moved[:taken] + moved[taken + 1:], 0))
+                else:
+                    inside.append(_index(moved, 0))
+            return inside, outside
+
+        for piece, (kind, start) in enumerate(zip(kinds, squares)):
+            if piece == 1:
+                continue
+            if kind == 'P':
+                targets = 0
+                if not occupied >> start - 8 & 1:
+                    targets = 1 << start - 8
+                    if start // 8 == 6 and not occupied >> start - 16 & 1:
+                        targets |= 1 << start - 16
+            else:
+                targets = _attacks(kind, start, occupied) & ~occupied
+                if kind == 'K':  # the kings cannot touch
+                    targets &= ~KING_ATTACKS[squares[1]]
+            for target in squares_of(targets):
+                moved = squares[:]
+                moved[piece] = target
+                if kind == 'P' and target < 8:  # promote
+                    for promotion in 'QRBN':
+                        outside.append(self._outside(
+                            kinds[:piece] + (promotion,) + kinds[piece + 1:],
+                            moved, 1))
+                else:
+                    inside.append(_index(moved, 1))
+        return inside, outside
+
+    def unmoves(self, index):
+        """Return the table indexes of the positions moving to an index."""
+        kinds = self.kinds
+        squares, black_to_move = _squares(index, len(kinds))
+        occupied = 0
+        for square in squares:
+            occupied |= 1 << square
+        found = []
+        if not black_to_move:  # black moved its king here
+            for start in squares_of(KING_ATTACKS[squares[1]] & ~occupied &
+                                    ~KING_ATTACKS[squares[0]]):
+                moved = squares[:]
+                moved[1] = start
+                found.append(_index(moved, 1))
+            return found
+
+        for piece, (kind, target) in enumerate(zip(kinds, squares)):
+            if piece == 1:
+                continue
+            if kind == 'P':
+                starts = 0
+                if target // 8 <= 5 and not occupied >> target + 8 & 1:
+                    starts = 1 << target + 8
+                    if target // 8 == 4 and not occupied >> target + 16 & 1:
+                        starts |= 1 << target + 16
+            else:  # the other pieces move back the way they came
+                starts = _attacks(kind, target, occupied) & ~occupied
+                if kind == 'K':
+                    starts &= ~KING_ATTACKS[squares[1]]
+            for start in squares_of(starts):
+                moved = squares[:]
+                moved[piece] = start
+                # white to move cannot be giving check already
+                if not _white_attacks(kinds, moved, occupied ^ 1 << target |
+                                      1 << start) >> squares[1] & 1:
+                    found.append(_index(moved, 0))
+        return found
+
+
+_generator = None  # the generator of a worker process
+
+
+def _start_worker(name, directory):
+    """Set up the generator of a worker process."""
+    global _generator
+    _generator = _Generator(name, directory)
+
+
+def _classify(start):
+    """Count the moves of a chunk of positions and find the mates.
+
+    Returns the values and move counts of the chunk, and the moves out of
+    the table as (index, value) pairs.
+    """
+    kinds = _generator.kinds
+    values, counts, outside = bytearray(CHUNK), bytearray(CHUNK), []
+    for offset in range(CHUNK):
+        squares, black_to_move = _squares(start + offset, len(kinds))
+        if not _legal(kinds, squares, black_to_move):
+            values[offset] = ILLEGAL
+            continue
+        inside, outside_values = _generator.moves(squares, black_to_move)
+        counts[offset] = len(inside) + len(outside_values)
+        if not counts[offset]:
+            occupied = 0
+            for square in squares:
+                occupied |= 1 << square
+            # checkmated if black is in check, white cannot be
+            if black_to_move and _white_attacks(
+                    kinds, squares, occupied ^ 1 << squares[1]) >> \
+                    squares[1] & 1:
+                values[offset] = 1
+        for value in outside_values:
+            if value != DRAW:
+                outside.append((start + offset, value))
+    return start, values, counts, outside
+
+
+def _unmove_all(indexes):
+    """Return the positions moving to any of the indexes."""
+    found = array('I')
+    for index in indexes:
+        found.extend(_generator.unmoves(index))
+    return found
+
+
+def _split(indexes, workers):
+    """Split indexes into pieces for the workers."""
+    size = max(CHUNK, len(indexes) // (workers * 4) + 1)
+    return [indexes[start:start + size]
+            for start in range(0, len(indexes), size)]
+
+
+def generate(name, directory=DIRECTORY, workers=1):
+    """Generate a table by retrograde analysis and write it to its file.
+
+    Positions get classified over the workers, then the results spread
+    backwards from the mates ply by ply: a position with a move to a lost
+    position is won, and one whose moves all reach won positions is lost.
+    """
+    size = 32 * 64 ** (len(_kinds(name)) - 1) * 2
+    values, counts = bytearray(size), bytearray(size)
+    pool = Pool(workers, _start_worker, (name, directory)) \
+        if workers > 1 else None
+    if pool is None:
+        _start_worker(name, directory)
+    map_ = pool.imap_unordered if pool else map
+    try:
+        # moves out of the table decide positions at some ply later on:
+        # ply -> positions won then, and positions losing a move then
+        outside_wins, outside_losses = defaultdict(list), defaultdict(list)
+        # positions decided at the last ply, kept as 4-byte indexes
+        lost = array('I')
+        for start, chunk_values, chunk_counts, outside in map_(
+                _classify, range(0, size, CHUNK)):
+            values[start:start + CHUNK] = chunk_values
+            counts[start:start + CHUNK] = chunk_counts
+            lost.extend(start + offset for offset, value in
+                        enumerate(chunk_values) if value == 1)
+            for index, value in outside:
+                if value % 2:  # the opponent gets mated, plies = value - 1
+                    outside_wins[value].append(index)
+                else:
+                    outside_losses[value].append(index)
+
+        won, ply = array('I'), 1
+        while lost or won or outside_wins or outside_losses:
+            # positions moving to a position lost at the last ply are won
+            new_won = array('I')
+            for found in map_(_unmove_all, _split(lost, workers)):
+                for index in found:
+                    if not values[index]:
+                        values[index] = ply + 1
+                        new_won.append(index)
+            for index in outside_wins.pop(ply, []):
+                if not values[index]:
+                    values[index] = ply + 1
+                    new_won.append(index)
+            # positions whose last move reaches a won position are lost
+            new_lost = array('I')
+            for found in map_(_unmove_all, _split(won, workers)):
+                new_lost.extend(found)
+            new_lost.extend(outside_losses.pop(ply, []))
+            lost = array('I')
+            for index in new_lost:
+                counts[index] -= 1
+                if not counts[index] and not values[index]:
+                    values[index] = ply + 1
+                    lost.append(index)
+            won, ply = new_won, ply + 1
+            if ply >= ILLEGAL - 1:
+                raise ValueError('mates too long to store in ' + name)
+    finally:
+        if pool is not None:
+            pool.close()
+            pool.join()
+
+    makedirs(directory, exist_ok=True)
+    with open(path.join(directory, name + '.tb'), 'wb') as file:
+        file.write(values)
+    return values
+
+
+class Tablebases:
+    """The class for probing generated tables through memory maps.
+
+    A table gets mapped when it is first probed, and then every probe
+    reads a single byte of it.
+    """
+
+    def __init__(self, directory=DIRECTORY):
+        self.directory = directory
+        self.files, self.maps = {}, {}
+
+    def close(self):
+        """Unmap and close the tables."""
+        for table in self.maps.values():
+            table.close()
+        for file in self.files.values():
+            file.close()
+        self.files, self.maps = {}, {}
+
+    def available(self, name):
+        """Check whether the file of a table exists."""
+        return name in self.maps or \
+            path.exists(path.join(self.directory, name + '.tb'))
+
+    def value(self, name, squares, black_to_move):
+        """Return the byte stored for squares of a table."""
+        if name not in self.maps:
+            file = open(path.join(self.directory, name + '.tb'), 'rb')
+            self.files[name] = file
+            self.maps[name] = mmap(file.fileno(), 0, access=ACCESS_READ)
+        return self.maps[name][_index(squares, black_to_move)]
+
+    def probe(self, position):
+        """Return (outcome, plies to mate) for the side to move, or None.
+
+        The outcome is 'win', 'draw', or 'loss'. None means no table
+        covers the position.
+        """
+        pieces = {'w': [], 'b': []}
+        for symbol, squares in position.piece_coordinate.items():
+            if symbol[1] != 'K':
+                pieces[symbol[0]].extend((symbol[1], square)
+                                         for square in squares)
+        if pieces['w'] and pieces['b'] or any(
+                any(flags.values()) for flags in
+                position.castle_flags.values()):
+            return None  # tables have one side with pieces and no castling
+        strong = 'b' if pieces['b'] else 'w'
+        kinds = [kind for kind, _ in pieces[strong]]
+        if not kinds or kinds in (['B'], ['N']):
+            return 'draw', 0
+        name = table_name(kinds)
+        if not self.available(name):
+            return None
+
+        # tables have white as the strong side, so black gets flipped
+        flip = 0 if strong == 'w' else 56
+        weak = 'b' if strong == 'w' else 'w'
+        squares = [position.piece_coordinate[strong + 'K'][0] ^ flip,
+                   position.piece_coordinate[weak + 'K'][0] ^ flip] + \
+            [square ^ flip for _, square in sorted(
+                pieces[strong], key=lambda piece: PIECE_ORDER.index(
+                    piece[0]))]
+        value = self.value(name, squares, position.turn != strong)
+        if value == DRAW or value == ILLEGAL:
+            return 'draw', 0
+        return 'win' if value % 2 == 0 else 'loss', value - 1
+
+
+def main():
+    """Generate tables from the command line."""
+    parser = ArgumentParser(description='Generate endgame tablebases.')
+    parser.add_argument('tables', nargs='*', default=TABLES,
+                        help=f'tables among {", ".join(TABLES)}')
+    parser.add_argument('--directory', default=DIRECTORY)
+    parser.add_argument('--workers', type=int, default=cpu_count())
+    args = parser.parse_args()
+    for name in TABLES:  # tables get generated after the ones they need
+        if name not in args.tables:
+            continue
+        time = perf_counter()
+        values = generate(name, args.directory, args.workers)
+        decided = [value for value in values if value not in (DRAW, ILLEGAL)]
+        print(f'{name}  positions {len(values)}  '
+              f'decided {len(decided)}  longest mate '
+              f'{max(decided, default=1) - 1} plies  '
+              f'time {perf_counter() - time:.1f}s', file=stderr)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,90 @@
+EXACT, LOWER, UPPER = 1, 2, 3  # bound types, 0 marks an empty entry
+WORDS_PER_BUCKET = 4  # two entries of a key word and a data word each
+BYTES_PER_BUCKET = WORDS_PER_BUCKET * 8
+SCORE_OFFSET = 1 << 19  # scores are stored unsigned in 20 bits
+
+
+def pack(move, score, depth, bound, age):
+    """Pack an entry into a 64-bit data word."""
+    # bits 0-15 -> move, bits 16-35 -> score, bits 36-43 -> depth,
+    # bits 44-45 -> bound type, bits 46-51 -> age of the search
+    return move | (score + SCORE_OFFSET) << 16 | depth << 36 | \
+        bound << 44 | age << 46
+
+
+class TranspositionTable:
+    """The class for a fixed-size table of searched positions.
+
+    Entries sit in buckets of two: the first keeps the deepest search of
+    the current one and the second takes whatever does not fit there.
+    The hash word of an entry is stored XORed with its data word, so an
+    entry torn by processes writing it at once never matches a probe.
+    """
+
+    def __init__(self, size_mb=16, buffer=None):
+        """
+        @param size_mb: megabytes to take, the table never grows past it
+        @param buffer: a writable buffer to keep the entries in instead
+        """
+        if buffer is None:
+            buffer = bytearray(max(1, size_mb * 2 ** 20 // BYTES_PER_BUCKET) *
+                               BYTES_PER_BUCKET)
+        self.bytes = memoryview(buffer).cast('B')
+        self.words = self.bytes.cast('Q')
+        self.buckets = len(self.words) // WORDS_PER_BUCKET
+        self.age = 0
+
+    def clear(self):
+        """Empty the table."""
+        chunk = bytes(2 ** 20)  # zero a megabyte at a time
+        for offset in range(0, len(self.bytes), len(chunk)):
+            size = min(len(chunk), len(self.bytes) - offset)
+            self.bytes[offset:offset + size] = chunk[:size]
+        self.age = 0
+
+    def release(self):
+        """Let go of the buffer, so that shared memory can be closed."""
+        self.words.release()
+        self.bytes.release()
+
+    def new_search(self):
+        """Age the entries, letting a new search replace the old ones."""
+        self.age = (self.age + 1) & 63
+
+    def probe(self, hash_):
+        """Return (move, score, depth, bound) stored for a hash, or None."""
+        words = self.words
+        index = hash_ % self.buckets * WORDS_PER_BUCKET
+        for slot in (index, index + 2):
+            data = words[slot + 1]
+            if data and words[slot] ^ data == hash_:
+                return (data & 0xFFFF,
+                        (data >> 16 & 0xFFFFF) - SCORE_OFFSET,
+                        data >> 36 & 0xFF, data >> 44 & 3)
+        return None
+
+    def store(self, hash_, move, score, depth, bound):
+        """Store a searched position."""
+        words = self.words
+        index = hash_ % self.buckets * WORDS_PER_BUCKET
+        data = words[index + 1]
+        same = words[index] ^ data == hash_
+        if same or not data or depth >= data >> 36 & 0xFF or \
+                data >> 46 & 63 != self.age:
+            # the depth-preferred entry takes deeper searches, and any
+            # search once its own entry is stale
+            slot = index
+            if same and not move:
+                move = data & 0xFFFF  # keep the best move already known
+        else:
+            slot = index + 2  # the always-replace entry
+        data = pack(move, score, depth, bound, self.age)
+        words[slot], words[slot + 1] = hash_ ^ data, data
+
+    def hashfull(self):
+        """Return how many of a thousand entries hold the current search."""
+        words, used = self.words, 0
+        for slot in range(0, min(2000, len(self.words)), 2):
+            if words[slot + 1] and words[slot + 1] >> 46 & 63 == self.age:
+                used += 1
+        return used * 1000 // (min(2000, len(self.words)) // 2)
@@ -0,0 +1,219 @@
+import sys
+from threading import Event, Lock, Thread
+
+from engine import Engine, MATE, MAX_PLY
+from position import move_name, Position
+
+
+NAME = 'Python Chess Project'
+AUTHOR = 'the Python Chess Project authors'
+DEFAULT_HASH = 16  # megabytes
+MOVES_TO_GO = 30  # moves the remaining clock time is spread over by default
+SAFETY_MARGIN = 0.05  # seconds kept back for answering with the move
+
+
+def parse_move(position, text):
+    """Return the legal move of a position in UCI notation like e7e8q."""
+    for move in position.generate_legal_moves():
+        if move_name(move) == text:
+            return move
+    raise ValueError(f'illegal move {text}')
+
+
+def score_text(score):
+    """Return a search score as a UCI score, in centipawns or mates."""
+    if score >= MATE - MAX_PLY:
+        return f'mate {(MATE - score + 1) // 2}'
+    if score <= -MATE + MAX_PLY:
+        return f'mate {-((MATE + score) // 2)}'
+    return f'cp {score}'
+
+
+class Uci:
+    """The class for speaking UCI over standard input and output.
+
+    The search runs on a thread of its own, so commands such as stop and
+    isready get read and answered while it goes on.
+    """
+
+    def __init__(self, output=sys.stdout):
+        self.output = output
+        self.lock = Lock()  # info lines and answers must not interleave
+        self.hash_mb, self.workers = DEFAULT_HASH, 1
+        self.engine = None
+        self.position = Position()
+        self.thread = None
+        self.stop_requested = Event()  # ends an infinite search
+
+    def send(self, line):
+        """Write a line to the GUI."""
+        with self.lock:
+            self.output.write(line + '\n')
+            self.output.flush()
+
+    def get_engine(self):
+        """Return the engine, creating it with the current options."""
+        if self.engine is None:
+            self.engine = Engine(self.hash_mb, self.workers)
+        return self.engine
+
+    def close_engine(self):
+        """Close the engine, so that options take effect on the next one."""
+        if self.engine is not None:
+            self.engine.close()
+            self.engine = None
+
+    def set_option(self, words):
+        """Handle setoption name <id> value <x>."""
+        if 'value' not in words:
+            return
+        name = ' '.join(words[1:words.index('value')]).lower()
+        value = ' '.join(words[words.index('value') + 1:])
+        try:
+            if name == 'hash':
+                self.hash_mb = max(1, int(value))
+            elif name == 'threads':
+                self.workers = max(1, int(value))
+            else:
+                return
+        except ValueError:
+            return
+        self.close_engine()
+
+    def set_position(self, words):
+        """Handle position [startpos | fen <fen>] [moves <moves>]."""
+        moves = words.index('moves') if 'moves' in words else len(words)
+        try:
+            if words and words[0] == 'fen':
+                position = Position(' '.join(words[1:moves]))
+            else:
+                position = Position()
+            for text in words[moves + 1:]:
+                position.make_move(parse_move(position, text))
+        except ValueError as error:
+            self.send(f'info string {error}')
+            return
+        self.position = position
+
+    def limits(self, words):
+        """Return the depth, seconds, and nodes to search for a go command."""
+        values = {}
+        for index, word in enumerate(words[:-1]):
+            if word in ('depth', 'movetime', 'wtime', 'btime', 'winc', 'binc',
+                        'movestogo', 'nodes'):
+                try:
+                    values[word] = int(words[index + 1])
+                except ValueError:
+                    pass
+        depth = values.get('depth', MAX_PLY)
+        time_limit = None
+        if 'movetime' in values:
+            time_limit = values['movetime'] / 1000
+        else:
+            color = self.position.turn
+            if color + 'time' in values:
+                # spread the clock over the moves to go and add most of
+                # the increment, never planning to use more than the clock
+                clock = values[color + 'time'] / 1000
+                increment = values.get(color + 'inc', 0) / 1000
+                time_limit = min(
+                    clock / values.get('movestogo', MOVES_TO_GO) +
+                    increment * 3 / 4, clock / 2)
+        if time_limit is not None:
+            time_limit = max(0.01, time_limit - SAFETY_MARGIN)
+        return depth, time_limit, values.get('nodes')
+
+    def report(self, result):
+        """Send an info line for a finished iteration."""
+        self.send(f'info depth {result.depth} '
+                  f'score {score_text(result.score)} nodes {result.nodes} '
+                  f'nps {result.nps} time {int(result.time * 1000)} '
+                  f'hashfull {self.engine.table.hashfull()} '
+                  f'pv {" ".join(move_name(move) for move in result.pv)}')
+
+    def think(self, position, depth, time_limit, node_limit, infinite):
+        """Search on the search thread and send the best move."""
+        result = self.engine.search(position, depth, time_limit, node_limit,
+                                    self.report)
+        if infinite:  # the move is only sent once the GUI asks to stop
+            self.stop_requested.wait()
+        self.send('bestmove ' +
+                  (move_name(result.move) if result.move else '0000'))
+
+    def go(self, words):
+        """Handle go, starting the search thread."""
+        self.stop()
+        depth, time_limit, node_limit = self.limits(words)
+        infinite = 'infinite' in words or 'ponder' in words
+        self.stop_requested.clear()
+        self.get_engine()
+        # the search unmakes every move it makes, and commands changing the
+        # position stop it first, so it can search the position itself
+        self.thread = Thread(target=self.think, daemon=True, args=(
+            self.position, depth, time_limit, node_limit, infinite))
+        self.thread.start()
+
+    def stop(self):
+        """Stop the search, if any, and wait for its best move."""
+        if self.thread is None:
+            return
+        self.stop_requested.set()
+        while self.thread.is_alive():
+            # keep asking, a search thread just starting clears the flag
+            self.engine.stop()
+            self.thread.join(0.01)
+        self.thread = None
+
+    def command(self, line):
+        """Handle a line from the GUI, return False once told to quit."""
+        words = line.split()
+        if not words:
+            return True
+        name, words = words[0], words[1:]
+        if name == 'uci':
+            self.send(f'id name {NAME}')
+            self.send(f'id author {AUTHOR}')
+            self.send(f'option name Hash type spin default {DEFAULT_HASH} '
+                      f'min 1 max 4096')
+            self.send('option name Threads type spin default 1 min 1 max 64')
+            self.send('uciok')
+        elif name == 'isready':
+            self.send('readyok')
+        elif name == 'setoption':
+            self.stop()
+            self.set_option(words)
+        elif name == 'ucinewgame':
+            self.stop()
+            if self.engine is not None:
+                self.engine.table.clear()
+                self.engine.history.clear()
+            self.position = Position()
+        elif name == 'position':
+            self.stop()
+            self.set_position(words)
+        elif name == 'go':
+            self.go(words)
+        elif name == 'stop':
+            self.stop()
+        elif name == 'quit':
+            self.stop()
+            self.close_engine()
+            return False
+        return True
+
+    def loop(self, input_=sys.stdin):
+        """Read commands until quit or the end of the input."""
+        for line in input_:
+            if not self.command(line):
+                return
+        self.stop()
+        self.close_engine()
+
+
+def main():
+    """Speak UCI over standard input and output."""
+    Uci().loop()
+
+
+if __name__ == '__main__':
+    main()
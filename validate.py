@@ -0,0 +1,114 @@
+from argparse import ArgumentParser
+from collections import deque
+from json import dumps
+from multiprocessing import cpu_count, Pool
+from pathlib import Path
+from sys import stderr, stdout
+from time import perf_counter
+
+from pgn import replay_game, RESULTS, split_games
+
+
+BATCH_SIZE = 64  # games sent to a worker at once
+BATCHES_PER_WORKER = 4  # batches in flight, so big files never pile up
+
+
+def pgn_files(path):
+    """Return the PGN files of a path, in order."""
+    path = Path(path)
+    if path.is_dir():
+        return sorted(file for file in path.rglob('*') if
+                      file.suffix.lower() == '.pgn' and file.is_file())
+    return [path]
+
+
+def read_batches(paths):
+    """Yield (file, first game index, game texts) batches from PGN files."""
+    for path in paths:
+        with open(path, encoding='utf-8', errors='replace') as file:
+            batch, index = [], 0
+            for text in split_games(file):
+                batch.append(text)
+                if len(batch) == BATCH_SIZE:
+                    yield str(path), index, batch
+                    batch, index = [], index + BATCH_SIZE
+            if batch:
+                yield str(path), index, batch
+
+
+def check_game(text):
+    """Replay a game and report whether it is legal and how it ended."""
+    game = replay_game(text)
+    report = {'white': game.tags.get('White', '?'),
+              'black': game.tags.get('Black', '?'),
+              'result': game.result, 'plies': len(game.moves),
+              'status': 'ongoing', 'reason': None, 'error': game.error}
+    if game.error is not None:
+        report['status'] = 'invalid'
+        return report
+    result = game.position.result()
+    if result:
+        report['status'], report['reason'] = result
+        # a game the rules decided should be scored the same way
+        if game.result != RESULTS[result[0]]:
+            report['error'] = f'result {game.result} but {" ".join(result)}'
+    return report
+
+
+def check_batch(batch):
+    """Check a batch of games in a worker."""
+    path, index, texts = batch
+    reports = []
+    for number, text in enumerate(texts, index + 1):
+        report = check_game(text)
+        report['file'], report['game'] = path, number
+        reports.append(report)
+    return reports
+
+
+def check_all(paths, workers):
+    """Yield the report of every game in the files, in order."""
+    batches = read_batches(paths)
+    if workers <= 1:
+        for batch in batches:
+            yield from check_batch(batch)
+        return
+    with Pool(workers) as pool:
+        # keep a bounded queue of batches, unlike Pool.imap that reads all
+        # of its input ahead
+        pending = deque()
+        for batch in batches:
+            pending.append(pool.apply_async(check_batch, (batch,)))
+            if len(pending) >= workers * BATCHES_PER_WORKER:
+                yield from pending.popleft().get()
+        while pending:
+            yield from pending.popleft().get()
+
+
+def main():
+    """Validate PGN games from the command line."""
+    parser = ArgumentParser(
+        description='Replay PGN games and report on each of them as JSONL.')
+    parser.add_argument('path', help='a PGN file or a directory of them')
+    parser.add_argument('--workers', type=int, default=cpu_count())
+    parser.add_argument('--output', help='write JSONL here, not to stdout')
+    args = parser.parse_args()
+
+    output = open(args.output, 'w') if args.output else stdout
+    games = invalid = 0
+    time = perf_counter()
+    try:
+        for report in check_all(pgn_files(args.path), args.workers):
+            output.write(dumps(report) + '\n')
+            games += 1
+            invalid += report['error'] is not None
+    finally:
+        if output is not stdout:
+            output.close()
+    time = perf_counter() - time
+    print(f'games {games}  with errors {invalid}  time {time:.3f}s  '
+          f'{games / time if time else 0:.1f} games/s', file=stderr)
+
+
+if __name__ == '__main__':
+    main()